@@ -9,30 +9,40 @@ logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").set
 import streamlit as st
 import pandas as pd
 import numpy as np
-import requests
 import altair as alt
-from backend.recommender import get_recommendations, filter_by_genre
+from backend.recommender import get_recommendations
 from backend.matcher import match_favs_with_features
-from backend.spotify_auth import get_spotify_client, get_user_liked_tracks
-from utils.dataset_loader import get_spotify_dataset
-from backend.db_sqlite import init_db, save_user_profile, load_user_profile
+from backend.covers import get_cover_resolver
+from backend.spotify_auth import get_spotify_client
+from backend.tracing import Tracer, default_sinks
+from backend.result_cache import get_result_cache, recommendation_key
+from backend.library_sync import load_saved_tracks, sync_saved_tracks
+from utils.dataset_loader import (
+    get_catalog,
+    get_catalog_feature_store,
+    get_catalog_cluster_index,
+    get_catalog_novelty_scores,
+    get_catalog_ann_index,
+    get_catalog_genre_index,
+    get_catalog_range_indexes,
+    get_catalog_match_index,
+)
+from backend.db_sqlite import (
+    DISLIKE,
+    LIKE,
+    init_db,
+    load_user_profile,
+    save_user_profile,
+)
+from backend.user_profile import (
+    load_profile_vectors,
+    rebuild_profile_vectors,
+    record_feedback,
+)
 
 st.set_page_config(page_title="🎧 Recomendador Spotify SSO", layout="wide")
 
 
-def get_album_cover(track_id):
-    url = (
-        f"https://open.spotify.com/oembed?url=https://open.spotify.com/track/{track_id}"
-    )
-    try:
-        resp = requests.get(url, timeout=5)
-        if resp.ok:
-            return resp.json().get("thumbnail_url", "")
-    except:
-        return ""
-    return ""
-
-
 init_db()
 
 # -------------------------
@@ -73,8 +83,8 @@ if not st.session_state["logged_in"]:
         st.session_state["user_id"] = user_info["id"]
         st.session_state["logged_in"] = True
         with st.spinner("Obteniendo tus canciones gustadas..."):
-            liked_tracks = get_user_liked_tracks(sp, limit=200)
-            st.session_state["favs_df"] = pd.DataFrame(liked_tracks)
+            sync_saved_tracks(sp, user_info["id"])
+            st.session_state["favs_df"] = load_saved_tracks(user_info["id"])
         st.rerun()
 
 else:
@@ -91,6 +101,7 @@ else:
             "disliked_tracks",
             "merged_favs",
             "recs",
+            "trace",
         ]:
             st.session_state.pop(k, None)
         st.rerun()
@@ -98,12 +109,42 @@ else:
 # -------------------------
 #    CARGA DATASET NUBE
 # -------------------------
-tracks_df = get_spotify_dataset()
-if tracks_df is None or tracks_df.empty:
+catalog, catalog_version = get_catalog()
+if catalog is None or len(catalog) == 0:
     st.warning("No se pudo cargar el dataset de canciones.")
     st.stop()
 else:
-    st.success(f"Catálogo cargado: {len(tracks_df):,} canciones disponibles")
+    st.success(f"Catálogo cargado: {len(catalog):,} canciones disponibles")
+
+tracks_df = catalog.tracks
+attr_cols = catalog.attr_cols
+feature_store = get_catalog_feature_store(tracks_df, attr_cols, catalog_version)
+cluster_index = get_catalog_cluster_index(feature_store)
+novelty_scores = get_catalog_novelty_scores(feature_store)
+ann_index = get_catalog_ann_index(feature_store)
+genre_index = get_catalog_genre_index(
+    tracks_df, feature_store, catalog.genre_aliases
+)
+popularity_index, year_index = get_catalog_range_indexes(tracks_df, feature_store)
+match_index = get_catalog_match_index(
+    tracks_df, feature_store, catalog.track_id_map
+)
+
+
+def catalog_rows(track_ids):
+    # Fila canónica (= fila del feature store) de cada track_id, -1 si no está
+    return [match_index.by_id.get(track_id, -1) for track_id in track_ids]
+
+
+def refresh_profile_vectors():
+    return rebuild_profile_vectors(
+        st.session_state["user_id"],
+        feature_store,
+        catalog_rows(st.session_state["merged_favs"]["track_id"]),
+        catalog_rows(st.session_state["liked_tracks"]),
+        catalog_rows(st.session_state["disliked_tracks"]),
+    )
+
 
 # -------------------------
 #     LÓGICA RECOMENDADOR
@@ -119,27 +160,24 @@ if st.session_state["logged_in"] and st.session_state["favs_df"] is not None:
 
     st.header("🎼 Tu perfil musical extraído")
 
-    attr_cols = [
-        "danceability",
-        "energy",
-        "key",
-        "loudness",
-        "mode",
-        "speechiness",
-        "acousticness",
-        "instrumentalness",
-        "liveness",
-        "valence",
-        "tempo",
-        "duration_ms",
-    ]
-
     # Emparejar favoritas automáticamente si no existe ya
+    profile_vectors = None
     if "merged_favs" not in st.session_state:
-        merged_favs = match_favs_with_features(favs_df, tracks_df)
+        merged_favs = match_favs_with_features(
+            favs_df, catalog, index=match_index, fuzzy=True
+        )
         st.session_state["merged_favs"] = merged_favs
+        profile_vectors = refresh_profile_vectors()
     merged_favs = st.session_state["merged_favs"]
 
+    # Perfil incremental guardado: solo se recalcula si cambió el escalado
+    if profile_vectors is None:
+        profile_vectors = load_profile_vectors(
+            st.session_state["user_id"], feature_store
+        )
+    if profile_vectors is None:
+        profile_vectors = refresh_profile_vectors()
+
     if not merged_favs.empty:
         perfil_media = merged_favs[attr_cols].mean()
         norm_perfil = perfil_media.copy()
@@ -235,7 +273,13 @@ if st.session_state["logged_in"] and st.session_state["favs_df"] is not None:
             pop_min = st.slider("Popularidad mínima", 0, 100, 60)
             year_min = st.number_input("Año desde", 1950, 2025, 2000)
             year_max = st.number_input("Año hasta", 1950, 2025, 2025)
-            genre_filter = st.text_input("Género (opcional)")
+            genre_filter = st.text_input("Género (opcional, varios separados por comas)")
+            debug_trace = st.checkbox("🔬 Tiempos por etapa (depuración)")
+            cache_stats = get_result_cache().stats()
+            st.caption(
+                f"Caché de resultados: {cache_stats['hits']} aciertos / "
+                f"{cache_stats['misses']} fallos"
+            )
             if st.button("🎯 Obtener Recomendaciones", type="primary"):
                 with st.spinner("Generando recomendaciones..."):
                     already_liked_ids = (
@@ -243,83 +287,138 @@ if st.session_state["logged_in"] and st.session_state["favs_df"] is not None:
                         if "Spotify - id" in favs_df
                         else set()
                     )
-                    filtered_tracks = tracks_df.copy()
-                    if genre_filter:
-                        filtered_tracks = filter_by_genre(filtered_tracks, genre_filter)
-
-                    liked_df = pd.DataFrame()
-                    disliked_df = pd.DataFrame()
-                    if st.session_state["liked_tracks"]:
-                        liked_df = tracks_df[
-                            tracks_df["id"].isin(st.session_state["liked_tracks"])
-                        ]
-                    if st.session_state["disliked_tracks"]:
-                        disliked_df = tracks_df[
-                            tracks_df["id"].isin(st.session_state["disliked_tracks"])
-                        ]
-
-                    recs = get_recommendations(
-                        merged_favs,
-                        filtered_tracks,
-                        attr_cols,
-                        topn=20,
-                        pop_min=pop_min,
-                        year_min=year_min,
-                        year_max=year_max,
-                        exclude_ids=already_liked_ids,
-                        liked_tracks=liked_df if not liked_df.empty else None,
-                        disliked_tracks=disliked_df if not disliked_df.empty else None,
+                    user_profile = profile_vectors.profile()
+                    filters = {
+                        "pop_min": pop_min,
+                        "year_min": year_min,
+                        "year_max": year_max,
+                        "genre": genre_filter or None,
+                        "library_size": len(merged_favs),
+                    }
+                    # Misma petición (perfil, feedback, filtros) = mismo resultado
+                    key = recommendation_key(
+                        user_profile,
+                        st.session_state["liked_tracks"],
+                        st.session_state["disliked_tracks"],
+                        filters,
+                        20,
+                        feature_store.version,
+                        exclude=already_liked_ids,
+                    )
+                    # Trazas: panel de depuración y/o JSONL (RECOMMENDER_TRACE_PATH)
+                    sinks = default_sinks()
+                    tracer = (
+                        Tracer(memory=debug_trace, sinks=sinks)
+                        if debug_trace or sinks
+                        else None
                     )
+                    try:
+                        recs = get_result_cache().get_or_compute(
+                            key,
+                            lambda: get_recommendations(
+                                merged_favs,
+                                catalog,
+                                attr_cols,
+                                topn=20,
+                                pop_min=pop_min,
+                                year_min=year_min,
+                                year_max=year_max,
+                                exclude_ids=already_liked_ids,
+                                user_profile=user_profile,
+                                feature_store=feature_store,
+                                cluster_index=cluster_index,
+                                novelty_scores=novelty_scores,
+                                ann_index=ann_index,
+                                genre=genre_filter or None,
+                                genre_index=genre_index,
+                                popularity_index=popularity_index,
+                                year_index=year_index,
+                                tracer=tracer,
+                            ),
+                        )
+                    finally:
+                        # Una excepción no debe dejar tracemalloc activo
+                        if tracer is not None:
+                            tracer.close()
+                    if tracer is not None:
+                        st.session_state["trace"] = tracer.finish(
+                            cached=not tracer.spans, n_results=len(recs)
+                        )
                     st.session_state["recs"] = recs
                     st.rerun()
 
+            trace = st.session_state.get("trace")
+            if debug_trace and trace:
+                st.subheader("🔬 Última petición")
+                if trace["cached"]:
+                    st.caption("Resultado servido desde la caché")
+                else:
+                    st.caption(f"Total: {trace['total_seconds'] * 1000:.1f} ms")
+                    spans = pd.DataFrame(trace["spans"])
+                    spans["ms"] = spans.pop("seconds") * 1000
+                    spans["peak_mb"] = pd.to_numeric(spans.pop("peak_bytes")) / 2**20
+                    st.dataframe(spans, hide_index=True)
+
         # Mostrar recomendaciones
         if "recs" in st.session_state:
             recs = st.session_state["recs"]
             st.header(f"🎵 Recomendaciones para ti ({len(recs)})")
+            # Todas las portadas de una vez: caché y peticiones en paralelo
+            covers = get_cover_resolver().resolve(recs["track_id"])
             for idx, row in recs.iterrows():
                 with st.container():
                     col1, col2, col3, col4 = st.columns([1, 3, 2, 1])
                     with col1:
-                        cover_url = get_album_cover(row["id"])
+                        cover_url = covers.get(row["track_id"])
                         if cover_url:
                             st.image(cover_url, width=100)
                     with col2:
-                        st.markdown(f"**{row['name']}**")
+                        st.markdown(f"**{row['track_name']}**")
                         st.caption(f"{row['artists']}")
                         st.markdown(
                             f"⭐ {row.get('popularity','')} • 📅 {row.get('release_date','')}"
                         )
                     with col3:
                         st.markdown(
-                            f"[▶️ Escuchar](https://open.spotify.com/track/{row['id']})",
+                            f"[▶️ Escuchar](https://open.spotify.com/track/{row['track_id']})",
                             unsafe_allow_html=True,
                         )
                         st.markdown(
-                            f'<iframe src="https://open.spotify.com/embed/track/{row["id"]}" width="140" height="80" frameborder="0" allowtransparency="true" allow="encrypted-media"></iframe>',
+                            f'<iframe src="https://open.spotify.com/embed/track/{row["track_id"]}" width="140" height="80" frameborder="0" allowtransparency="true" allow="encrypted-media"></iframe>',
                             unsafe_allow_html=True,
                         )
                     with col4:
+                        track_id = row["track_id"]
+                        liked = st.session_state["liked_tracks"]
+                        disliked = st.session_state["disliked_tracks"]
                         col_like, col_dislike = st.columns(2)
                         with col_like:
-                            if st.button("👍", key=f"like_{row['id']}"):
-                                if row["id"] not in st.session_state["liked_tracks"]:
-                                    st.session_state["liked_tracks"].append(row["id"])
-                                    if row["id"] in st.session_state["disliked_tracks"]:
-                                        st.session_state["disliked_tracks"].remove(
-                                            row["id"]
-                                        )
+                            if st.button("👍", key=f"like_{track_id}"):
+                                if track_id not in liked:
+                                    liked.append(track_id)
+                                    if track_id in disliked:
+                                        disliked.remove(track_id)
+                                    record_feedback(
+                                        st.session_state["user_id"],
+                                        track_id,
+                                        LIKE,
+                                        feature_store,
+                                        tracks_df.index.get_loc(idx),
+                                    )
                                     st.rerun()
                         with col_dislike:
-                            if st.button("👎", key=f"dislike_{row['id']}"):
-                                if row["id"] not in st.session_state["disliked_tracks"]:
-                                    st.session_state["disliked_tracks"].append(
-                                        row["id"]
+                            if st.button("👎", key=f"dislike_{track_id}"):
+                                if track_id not in disliked:
+                                    disliked.append(track_id)
+                                    if track_id in liked:
+                                        liked.remove(track_id)
+                                    record_feedback(
+                                        st.session_state["user_id"],
+                                        track_id,
+                                        DISLIKE,
+                                        feature_store,
+                                        tracks_df.index.get_loc(idx),
                                     )
-                                    if row["id"] in st.session_state["liked_tracks"]:
-                                        st.session_state["liked_tracks"].remove(
-                                            row["id"]
-                                        )
                                     st.rerun()
                     st.markdown("---")
 
@@ -340,6 +439,7 @@ if st.session_state["logged_in"] and st.session_state["favs_df"] is not None:
                 st.session_state.get("liked_tracks", []),
                 st.session_state.get("disliked_tracks", []),
             )
+            refresh_profile_vectors()
             st.success("Perfil guardado correctamente en SQLite.")
 
         if st.button("Recargar mi perfil guardado"):
@@ -347,6 +447,7 @@ if st.session_state["logged_in"] and st.session_state["favs_df"] is not None:
             if profile:
                 st.session_state["liked_tracks"] = profile["likes"]
                 st.session_state["disliked_tracks"] = profile["dislikes"]
+                refresh_profile_vectors()
                 st.success("Perfil recargado!")
                 st.rerun()
             else:
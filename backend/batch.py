@@ -0,0 +1,379 @@
+"""
+Recomendaciones por lotes para muchos usuarios en una sola pasada.
+
+Los perfiles guardados (tabla ``profile_vectors``, ver backend.user_profile)
+se apilan en una matriz y se puntúan contra el catálogo con un producto
+matriz-matriz por tramo de filas; después cada usuario pasa por el mismo
+re-ranking que una petición individual. Los resultados se escriben en
+Parquet o CSV a medida que salen, sin acumularlos:
+
+    python -m backend.batch --output recomendaciones.parquet
+    python -m backend.batch --users u1 u2 --output recs.csv --pop-min 30
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from backend.db_sqlite import get_pool
+from backend.recommender import rank_candidates, filter_catalog_rows
+from backend.streaming import CHUNK_SIZE, TopK
+from backend.user_profile import read_profile_vectors
+
+# Usuarios que se puntúan juntos en cada producto matriz-matriz
+BATCH_USERS = 256
+OUTPUT_COLS = [
+    "track_id",
+    "track_name",
+    "artists",
+    "album_name",
+    "track_genre",
+    "popularity",
+]
+
+
+def load_batch_users(store, user_ids=None):
+    """
+    Usuarios con perfil vigente para el escalado de ``store`` (por defecto,
+    todos los que tienen ``profile_vectors`` de esta versión del catálogo).
+
+    Devuelve ``(user_ids, profiles, library_sizes, exclusions)``: ids, matriz
+    de perfiles (usuarios x atributos), nº de favoritas emparejadas de cada
+    uno (decide los pesos híbridos) y los ``track_id`` de su biblioteca
+    sincronizada, que se excluyen como en la app.
+    """
+    with get_pool().connection() as conn:
+        if user_ids is None:
+            query = (
+                "SELECT DISTINCT user_id FROM profile_vectors WHERE version = ? "
+                "ORDER BY user_id"
+            )
+            user_ids = [row[0] for row in conn.execute(query, (store.version,))]
+        ids, profiles, library_sizes, exclusions = [], [], [], []
+        for user_id in user_ids:
+            vectors = read_profile_vectors(conn, user_id, store.version)
+            profile = vectors.profile() if vectors is not None else None
+            if profile is None:
+                continue
+            saved = conn.execute(
+                "SELECT track_id FROM saved_tracks WHERE user_id = ?", (user_id,)
+            ).fetchall()
+            ids.append(user_id)
+            profiles.append(profile)
+            library_sizes.append(vectors.counts["base"])
+            exclusions.append({row[0] for row in saved})
+    dim = len(store.attr_cols)
+    profiles = np.asarray(profiles, dtype=np.float32).reshape(-1, dim)
+    return ids, profiles, np.asarray(library_sizes, dtype=np.int64), exclusions
+
+
+def _excluded_rows(track_id_map, exclude_ids, rows):
+    """
+    Filas canónicas de ``exclude_ids`` que además pasan los filtros comunes
+    (``rows`` está ordenado: basta una búsqueda binaria por fila excluida).
+    """
+    excluded = track_id_map.reindex(list(exclude_ids)).dropna()
+    excluded = np.unique(excluded.to_numpy(dtype=np.int64))
+    positions = np.minimum(np.searchsorted(rows, excluded), max(len(rows) - 1, 0))
+    return excluded[rows[positions] == excluded] if len(rows) else excluded[:0]
+
+
+def _allowed_clusters(cluster_index, profiles, rows, excluded, k):
+    """
+    Clusters por los que se enruta a cada usuario (usuarios x clusters), igual
+    que ClusterIndex.route sobre sus filas filtradas: los preferidos entre los
+    que conservan filas (al menos 3 y los necesarios para reunir ``k``), si le
+    quedan más de 100.
+    """
+    counts = np.bincount(cluster_index.labels[rows], minlength=cluster_index.n_clusters)
+    allowed = np.ones((len(profiles), cluster_index.n_clusters), dtype=bool)
+    for user, (profile, user_excluded) in enumerate(zip(profiles, excluded)):
+        if len(rows) - len(user_excluded) <= 100:
+            continue
+        user_counts = counts - np.bincount(
+            cluster_index.labels[user_excluded], minlength=cluster_index.n_clusters
+        )
+        preferred = cluster_index.preferred_clusters(
+            profile.reshape(1, -1), top=3, counts=user_counts, min_rows=k
+        )
+        allowed[user] = False
+        allowed[user, preferred] = True
+    return allowed
+
+
+def batch_top_candidates(
+    features,
+    rows,
+    profiles,
+    k,
+    excluded,
+    cluster_index=None,
+    chunk_size=CHUNK_SIZE,
+):
+    """
+    Top-``k`` candidatas de cada perfil entre las filas ``rows`` del catálogo.
+
+    Cada tramo de filas se puntúa contra todos los perfiles a la vez (un
+    producto matriz-matriz) y cada usuario conserva sus ``k`` mejores, así que
+    la memoria es O(tramo x usuarios + k x usuarios). ``excluded`` son las
+    filas descartadas de cada usuario (ordenadas).
+
+    Devuelve una lista ``(rows, scores)`` por usuario.
+    """
+    profiles = np.asarray(profiles, dtype=features.dtype)
+    norms = np.linalg.norm(profiles, axis=1, keepdims=True)
+    unit = np.divide(profiles, norms, out=np.zeros_like(profiles), where=norms > 0)
+
+    allowed = None
+    if cluster_index is not None:
+        allowed = _allowed_clusters(cluster_index, profiles, rows, excluded, k)
+
+    tops = [TopK(k) for _ in range(len(profiles))]
+    for start in range(0, len(rows), chunk_size):
+        chunk_rows = rows[start : start + chunk_size]
+        block = np.asarray(features[chunk_rows])
+        block_norms = np.sqrt(np.einsum("ij,ij->i", block, block))[:, None]
+        scores = np.zeros((len(chunk_rows), len(profiles)), dtype=block.dtype)
+        np.divide(block @ unit.T, block_norms, out=scores, where=block_norms > 0)
+
+        valid = np.ones(scores.shape, dtype=bool)
+        if allowed is not None:
+            valid &= allowed[:, cluster_index.labels[chunk_rows]].T
+        for user, user_excluded in enumerate(excluded):
+            lo, hi = np.searchsorted(user_excluded, [chunk_rows[0], chunk_rows[-1] + 1])
+            hits = np.searchsorted(chunk_rows, user_excluded[lo:hi])
+            valid[hits, user] = False
+
+        for user, top in enumerate(tops):
+            user_valid = np.flatnonzero(valid[:, user])
+            user_scores = scores[user_valid, user]
+            if len(user_scores) > k:
+                # Preselección barata; los empates en el umbral se conservan
+                threshold = np.partition(user_scores, len(user_scores) - k)[-k]
+                keep = user_scores >= threshold
+                user_valid, user_scores = user_valid[keep], user_scores[keep]
+            top.push(user_scores, chunk_rows[user_valid])
+    return [top.result() for top in tops]
+
+
+def batch_recommendations(
+    tracks_df,
+    feature_store,
+    users,
+    topn=20,
+    track_id_map=None,
+    cluster_index=None,
+    novelty_scores=None,
+    use_clustering=True,
+    novelty_boost=True,
+    candidate_pool=None,
+    rerank="hybrid",
+    diversity_weight=0.3,
+    max_per_artist=None,
+    max_per_album=None,
+    batch_size=BATCH_USERS,
+    chunk_size=CHUNK_SIZE,
+    **filters,
+):
+    """
+    Genera un DataFrame de recomendaciones (``user_id``, ``rank`` y las
+    columnas de la pista) por cada bloque de ``batch_size`` usuarios.
+
+    ``users`` es la tupla de load_batch_users. Los filtros (``pop_min``,
+    ``genre``, ``genre_index``...) se aplican una vez para todos, como en
+    filter_catalog_rows; los índices precalculados son los mismos que exige
+    el modo streaming del recomendador.
+    """
+    if track_id_map is None:
+        raise ValueError("El lote requiere el catálogo canónico (track_id_map)")
+    if use_clustering and cluster_index is None:
+        raise ValueError("El lote con clustering requiere cluster_index")
+    if novelty_boost and novelty_scores is None:
+        raise ValueError("El lote con novedad requiere novelty_scores")
+
+    user_ids, profiles, library_sizes, exclusions = users
+    rows = filter_catalog_rows(tracks_df, track_id_map=track_id_map, **filters)
+    k = candidate_pool or topn * 3
+    attr_cols = feature_store.attr_cols
+    output_cols = [col for col in OUTPUT_COLS if col in tracks_df.columns]
+    # Categorías como texto: el esquema no cambia entre bloques
+    text_cols = {col: str for col in output_cols if col != "popularity"}
+
+    for start in range(0, len(user_ids), batch_size):
+        stop = start + batch_size
+        excluded = [
+            _excluded_rows(track_id_map, exclude_ids, rows)
+            for exclude_ids in exclusions[start:stop]
+        ]
+        candidates = batch_top_candidates(
+            feature_store.features,
+            rows,
+            profiles[start:stop],
+            k,
+            excluded,
+            cluster_index=cluster_index if use_clustering else None,
+            chunk_size=chunk_size,
+        )
+        frames = []
+        for user_id, library_size, (candidate_rows, sim_scores) in zip(
+            user_ids[start:stop], library_sizes[start:stop], candidates
+        ):
+            if len(candidate_rows) == 0:
+                continue
+            top_candidates = tracks_df.iloc[candidate_rows].copy()
+            top_candidates["similarity"] = sim_scores
+            if novelty_boost:
+                top_candidates["novelty"] = np.asarray(novelty_scores[candidate_rows])
+            else:
+                top_candidates["novelty"] = 0.5
+            recs = rank_candidates(
+                top_candidates,
+                feature_store.take(candidate_rows),
+                library_size,
+                attr_cols,
+                topn,
+                rerank=rerank,
+                diversity_weight=diversity_weight,
+                max_per_artist=max_per_artist,
+                max_per_album=max_per_album,
+            )
+            recs = recs[output_cols]
+            recs.insert(0, "rank", np.arange(1, len(recs) + 1))
+            recs.insert(0, "user_id", user_id)
+            frames.append(recs)
+        if frames:
+            yield pd.concat(frames, ignore_index=True).astype(text_cols)
+
+
+# ===== SALIDA =====
+class ResultWriter:
+    """
+    Escribe bloques de resultados en Parquet (un row group por bloque) o CSV
+    (añadiendo filas) según la extensión, sin acumularlos en memoria.
+    """
+
+    def __init__(self, path, fmt=None):
+        self.path = path
+        self.fmt = fmt or os.path.splitext(path)[1].lstrip(".").lower()
+        if self.fmt not in ("parquet", "csv"):
+            raise ValueError(f"Formato de salida no soportado: {self.fmt}")
+        self.rows = 0
+        self._writer = None
+        self._tmp_path = f"{path}.tmp"
+
+    def write(self, frame):
+        if self.fmt == "parquet":
+            if self._writer is None:
+                table = pa.Table.from_pandas(frame, preserve_index=False)
+                self._writer = pq.ParquetWriter(self._tmp_path, table.schema)
+            else:
+                table = pa.Table.from_pandas(
+                    frame, schema=self._writer.schema, preserve_index=False
+                )
+            self._writer.write_table(table)
+        else:
+            frame.to_csv(
+                self._tmp_path, mode="a", header=self.rows == 0, index=False
+            )
+        self.rows += len(frame)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if os.path.exists(self._tmp_path):
+            # Solo se publica el fichero completo
+            os.replace(self._tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            if self._writer is not None:
+                self._writer.close()
+            if os.path.exists(self._tmp_path):
+                os.remove(self._tmp_path)
+        return False
+
+
+def write_batch_recommendations(path, batches, fmt=None):
+    """Vuelca los bloques de batch_recommendations; devuelve las filas escritas"""
+    with ResultWriter(path, fmt=fmt) as writer:
+        for frame in batches:
+            writer.write(frame)
+    return writer.rows
+
+
+def main(argv=None):
+    from backend.catalog import Catalog
+    from backend.catalog_index import GenreIndex
+    from backend.cluster_index import load_cluster_index
+    from backend.db_sqlite import init_db
+    from backend.feature_store import load_feature_store
+    from backend.novelty import load_novelty_scores
+    from utils.dataset_loader import (
+        SPOTIFY_DATASET_URL,
+        _read_source,
+        fetch_dataset,
+        prepare_catalog,
+    )
+
+    parser = argparse.ArgumentParser(description="Recomendaciones por lotes")
+    parser.add_argument("--output", required=True, help="fichero .parquet o .csv")
+    parser.add_argument("--format", choices=["parquet", "csv"])
+    parser.add_argument("--catalog", help="CSV/Parquet local (por defecto, el dataset)")
+    parser.add_argument("--users", nargs="+", help="ids de usuario (por defecto todos)")
+    parser.add_argument("--topn", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=BATCH_USERS)
+    parser.add_argument("--pop-min", type=int)
+    parser.add_argument("--year-min", type=int)
+    parser.add_argument("--year-max", type=int)
+    parser.add_argument("--genre")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    if args.catalog:
+        ext = os.path.splitext(args.catalog)[1].lstrip(".").lower()
+        catalog = Catalog.from_frame(prepare_catalog(_read_source(args.catalog, ext)))
+    else:
+        catalog = Catalog.from_frame(fetch_dataset(SPOTIFY_DATASET_URL))
+    store = load_feature_store(catalog.tracks, catalog.attr_cols)
+    init_db()
+    users = load_batch_users(store, args.users)
+    print(f"{len(users[0])} usuarios, {len(catalog):,} canciones", flush=True)
+
+    batches = batch_recommendations(
+        catalog.tracks,
+        store,
+        users,
+        topn=args.topn,
+        track_id_map=catalog.track_id_map,
+        cluster_index=load_cluster_index(store),
+        novelty_scores=load_novelty_scores(store),
+        batch_size=args.batch_size,
+        pop_min=args.pop_min,
+        year_min=args.year_min,
+        year_max=args.year_max,
+        genre=args.genre,
+        genre_index=GenreIndex.from_frame(
+            catalog.tracks, aliases=catalog.genre_aliases
+        ),
+    )
+    written = write_batch_recommendations(args.output, batches, fmt=args.format)
+    print(
+        f"{written} recomendaciones en {args.output} "
+        f"({time.perf_counter() - started:.1f}s)"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+
+def split_terms(query):
+    """Separa una consulta multi-género ("pop, rock") en términos normalizados"""
+    return [term.strip().lower() for term in re.split(r"[,;|]", query or "") if term.strip()]
+
+
+def genre_contains(values, query):
+    """Máscara de ``values`` (Serie de géneros) con alguno de los términos"""
+    pattern = "|".join(re.escape(term) for term in split_terms(query))
+    matches = values.str.contains(pattern, case=False, na=False)
+    return matches.to_numpy(dtype=bool, copy=True)
+
+
+def alias_genre_rows(genre_aliases, query, column="track_genre"):
+    """
+    Filas canónicas (ordenadas) con alguna versión descartada del género
+    consultado: lo mismo que GenreIndex añade con ``aliases``, sin el índice.
+    """
+    if genre_aliases is None:
+        return np.empty(0, dtype=np.int64)
+    hits = genre_contains(genre_aliases[column], query)
+    return np.unique(genre_aliases["row"].to_numpy(dtype=np.int64)[hits])
+
+
+class GenreIndex:
+    """
+    Índice invertido de géneros construido al cargar el catálogo.
+
+    Los géneros se guardan como códigos categóricos y cada categoría tiene su
+    lista de filas (CSR). Las consultas por subcadena se resuelven sobre las
+    categorías (unas decenas), no sobre las cadenas de todo el catálogo.
+    """
+
+    def __init__(self, index, categories, codes, offsets, postings):
+        self.index = index
+        self.categories = categories
+        self.codes = codes
+        self.offsets = offsets
+        self.postings = postings
+
+    @classmethod
+    def from_frame(cls, df, column="track_genre", aliases=None):
+        """
+        ``aliases`` (columnas ``row`` y ``column``) añade pertenencias extra,
+        p. ej. los géneros de las versiones duplicadas de una pista canónica.
+        """
+        values = df[column]
+        alias_rows = np.empty(0, dtype=np.int64)
+        if aliases is not None:
+            values = pd.concat([values, aliases[column]], ignore_index=True)
+            alias_rows = aliases["row"].to_numpy(dtype=np.int64)
+        all_codes, categories = pd.factorize(values, sort=True)
+        codes = all_codes[: len(df)].astype(np.int16)
+
+        rows = np.concatenate([np.arange(len(df), dtype=np.int64), alias_rows])
+        valid = all_codes >= 0
+        # Pares (categoría, fila) únicos, ordenados por categoría y fila
+        pairs = np.unique(all_codes[valid].astype(np.int64) * len(df) + rows[valid])
+        postings = pairs % max(len(df), 1)
+        offsets = np.zeros(len(categories) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(
+            np.bincount(pairs // max(len(df), 1), minlength=len(categories))
+        )
+        return cls(df.index, np.asarray(categories, dtype=object), codes, offsets, postings)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def matching_categories(self, query):
+        """Códigos de las categorías que contienen alguno de los términos"""
+        terms = split_terms(query)
+        lowered = [str(category).lower() for category in self.categories]
+        return np.array(
+            [code for code, name in enumerate(lowered) if any(t in name for t in terms)],
+            dtype=np.int64,
+        )
+
+    def rows(self, query):
+        """Filas (posiciones en el catálogo, ordenadas) de los géneros consultados"""
+        lists = [
+            self.postings[self.offsets[code] : self.offsets[code + 1]]
+            for code in self.matching_categories(query)
+        ]
+        if not lists:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(lists))
+
+    def mask(self, query):
+        """Bitmap booleano sobre el catálogo, para intersecar con otros filtros"""
+        mask = np.zeros(len(self), dtype=bool)
+        mask[self.rows(query)] = True
+        return mask
+
+    def chunk_mask(self, categories, start, stop):
+        """
+        Bitmap de las filas ``[start, stop)`` en alguna de ``categories`` (ver
+        matching_categories). Cada lista está ordenada por fila, así que basta
+        una búsqueda binaria por categoría: no se materializa el bitmap global.
+        """
+        mask = np.zeros(stop - start, dtype=bool)
+        for code in categories:
+            postings = self.postings[self.offsets[code] : self.offsets[code + 1]]
+            lo, hi = np.searchsorted(postings, [start, stop])
+            mask[postings[lo:hi] - start] = True
+        return mask
+
+    def filter(self, df, query):
+        """Aplica el filtro de género a un subconjunto del catálogo"""
+        return filter_frame(df, self.index, self.mask(query))
+
+
+class SortedRangeIndex:
+    """
+    Índice ordenado de una columna numérica (popularidad, año...).
+
+    Un rango ``[lo, hi]`` se resuelve con dos búsquedas binarias sobre los
+    valores ordenados y devuelve directamente el tramo de filas que cumple.
+    Los valores ausentes no se indexan (nunca pasan un filtro de rango).
+    """
+
+    def __init__(self, index, sorted_values, sorted_rows, n_rows):
+        self.index = index
+        self.sorted_values = sorted_values
+        self.sorted_rows = sorted_rows
+        self.n_rows = n_rows
+
+    @classmethod
+    def from_values(cls, index, values, dtype=np.int32):
+        values = pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(
+            dtype=np.float64
+        )
+        valid = np.flatnonzero(~np.isnan(values))
+        order = valid[np.argsort(values[valid], kind="stable")]
+        return cls(index, values[order].astype(dtype), order, len(values))
+
+    def __len__(self):
+        return self.n_rows
+
+    def rows(self, lo=None, hi=None):
+        """Filas con ``lo <= valor <= hi`` (extremos opcionales)"""
+        start = 0 if lo is None else np.searchsorted(self.sorted_values, lo, "left")
+        stop = (
+            len(self.sorted_values)
+            if hi is None
+            else np.searchsorted(self.sorted_values, hi, "right")
+        )
+        return self.sorted_rows[start:stop]
+
+    def mask(self, lo=None, hi=None):
+        mask = np.zeros(self.n_rows, dtype=bool)
+        mask[self.rows(lo, hi)] = True
+        return mask
+
+    def filter(self, df, lo=None, hi=None):
+        return filter_frame(df, self.index, self.mask(lo, hi))
+
+
+def filter_frame(df, index, mask):
+    """Aplica un bitmap sobre el catálogo a un subconjunto suyo"""
+    positions = index.get_indexer(df.index)
+    if (positions < 0).any():
+        raise ValueError("El DataFrame contiene filas que no pertenecen al catálogo")
+    return df[mask[positions]]
+
+
+def derive_release_year(df):
+    """Año de lanzamiento como entero compacto (Int16, nulo si no se conoce)"""
+    if "release_date" in df.columns:
+        years = pd.to_datetime(df["release_date"], errors="coerce").dt.year
+    elif "album_name" in df.columns:
+        # Extraer año del nombre del álbum si está disponible
+        years = pd.to_numeric(
+            df["album_name"].str.extract(r"(\d{4})", expand=False), errors="coerce"
+        )
+    else:
+        return None
+    return years.astype("Int16")
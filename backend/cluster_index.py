@@ -0,0 +1,149 @@
+import numpy as np
+from sklearn.cluster import KMeans, MiniBatchKMeans
+
+# A partir de este tamaño el modo "auto" usa MiniBatchKMeans
+MINIBATCH_THRESHOLD = 200_000
+CHUNK_SIZE = 100_000
+
+
+def rank_clusters(centroids, user_profile, counts, top=3, min_rows=0):
+    """
+    Clusters con filas candidatas (``counts`` por cluster) ordenados por
+    cercanía al perfil.
+
+    Se toman al menos ``top`` y se siguen añadiendo en orden de preferencia
+    hasta reunir ``min_rows`` filas, para que un subconjunto filtrado pequeño
+    no se quede sin candidatas (con pocas filas el KMeans por petición tampoco
+    descartaba nada).
+    """
+    centroids = np.asarray(centroids)
+    norms = np.linalg.norm(centroids, axis=1) * np.linalg.norm(user_profile)
+    sims = centroids @ np.ravel(user_profile) / np.maximum(norms, 1e-12)
+    ranked = np.argsort(sims)[::-1]
+    ranked = ranked[counts[ranked] > 0]
+    reached = np.searchsorted(np.cumsum(counts[ranked]), min_rows) + 1
+    return ranked[: max(top, reached)]
+
+
+class ClusterIndex:
+    """
+    Micro-géneros del catálogo calculados offline: centroides, cluster de cada
+    pista y listas invertidas (cluster -> filas) en formato CSR.
+    """
+
+    def __init__(self, centroids, labels, offsets, postings):
+        self.centroids = centroids
+        self.labels = labels
+        self.offsets = offsets
+        self.postings = postings
+
+    @property
+    def n_clusters(self):
+        return self.centroids.shape[0]
+
+    def cluster_rows(self, cluster):
+        return self.postings[self.offsets[cluster] : self.offsets[cluster + 1]]
+
+    def preferred_clusters(
+        self, user_profile, rows=None, top=3, counts=None, min_rows=0
+    ):
+        """
+        Clusters más cercanos al perfil entre los que tienen filas candidatas
+        (``rows``, o ``counts`` filas por cluster si ya se han acumulado); ver
+        rank_clusters.
+        """
+        if counts is None:
+            counts = np.bincount(self.labels[rows], minlength=self.n_clusters)
+        return rank_clusters(
+            self.centroids, user_profile, counts, top=top, min_rows=min_rows
+        )
+
+    def route(self, user_profile, rows, top=3, min_rows=0):
+        """
+        Devuelve las posiciones (dentro de ``rows``) de las pistas que caen en
+        los clusters preferidos (ver preferred_clusters), recorriendo sus
+        listas invertidas.
+        """
+        rows = np.asarray(rows)
+        clusters = self.preferred_clusters(
+            user_profile, rows, top=top, min_rows=min_rows
+        )
+        selected = np.concatenate([self.cluster_rows(c) for c in clusters])
+
+        # Búsqueda binaria sobre ``rows`` ordenadas, sin un array del tamaño
+        # del catálogo (sin track_id_map llegan ordenadas por popularidad)
+        order = None
+        if len(rows) > 1 and (rows[1:] < rows[:-1]).any():
+            order = np.argsort(rows, kind="stable")
+            rows = rows[order]
+        positions = np.searchsorted(rows, selected)
+        found = positions < len(rows)
+        positions = positions[found]
+        positions = positions[rows[positions] == selected[found]]
+        if order is not None:
+            positions = order[positions]
+        return np.sort(positions)
+
+
+def _fit_model(features, n_clusters, mode, random_state):
+    n_rows = features.shape[0]
+    if mode == "auto":
+        mode = "minibatch" if n_rows > MINIBATCH_THRESHOLD else "full"
+
+    if mode == "full":
+        model = KMeans(n_clusters=n_clusters, random_state=random_state, n_init=10)
+        model.fit(np.asarray(features))
+    elif mode == "minibatch":
+        model = MiniBatchKMeans(
+            n_clusters=n_clusters,
+            random_state=random_state,
+            batch_size=4096,
+            n_init=3,
+        )
+        model.fit(np.asarray(features))
+    elif mode == "incremental":
+        # Recorre el memmap por bloques: nunca carga el catálogo completo
+        model = MiniBatchKMeans(
+            n_clusters=n_clusters, random_state=random_state, batch_size=4096
+        )
+        for start in range(0, n_rows, CHUNK_SIZE):
+            chunk = np.asarray(features[start : start + CHUNK_SIZE])
+            if len(chunk) >= n_clusters:
+                model.partial_fit(chunk)
+    else:
+        raise ValueError(f"Modo de clustering no soportado: {mode}")
+    return model
+
+
+def build_cluster_index(store, n_clusters=None, mode="auto", random_state=42):
+    """Entrena el modelo de clusters sobre todo el catálogo y lo persiste en el store"""
+    features = store.features
+    n_rows = features.shape[0]
+    if n_clusters is None:
+        n_clusters = max(1, min(20, n_rows // 100))
+
+    model = _fit_model(features, n_clusters, mode, random_state)
+
+    labels = np.empty(n_rows, dtype=np.int16)
+    for start in range(0, n_rows, CHUNK_SIZE):
+        chunk = np.asarray(features[start : start + CHUNK_SIZE])
+        labels[start : start + len(chunk)] = model.predict(chunk)
+
+    postings = np.argsort(labels, kind="stable").astype(np.int64)
+    offsets = np.zeros(n_clusters + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(labels, minlength=n_clusters))
+
+    centroids = model.cluster_centers_.astype(np.float32)
+    store.save_array("cluster_centroids", centroids)
+    store.save_array("cluster_labels", labels)
+    store.save_array("cluster_offsets", offsets)
+    store.save_array("cluster_postings", postings)
+    return ClusterIndex(centroids, labels, offsets, postings)
+
+
+def load_cluster_index(store, **build_kwargs):
+    """Carga el índice de clusters de esta versión del catálogo o lo construye"""
+    names = ["cluster_centroids", "cluster_labels", "cluster_offsets", "cluster_postings"]
+    if all(store.has_array(name) for name in names):
+        return ClusterIndex(*(store.load_array(name) for name in names))
+    return build_cluster_index(store, **build_kwargs)
@@ -0,0 +1,162 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from backend.db_sqlite import get_pool
+
+OEMBED_URL = "https://open.spotify.com/oembed"
+COVER_TTL = 7 * 24 * 3600  # segundos
+MISS_TTL = 3600  # los fallos se reintentan antes que las portadas válidas
+CACHE_SIZE = 4096
+MAX_WORKERS = 8
+
+
+class CoverResolver:
+    """
+    Resuelve portadas de álbum (thumbnail del oEmbed de Spotify) por track_id.
+
+    Caché en dos niveles: LRU en memoria y tabla ``album_covers`` en SQLite
+    con caducidad. Los fallos se guardan como cadena vacía con una caducidad
+    más corta (caché negativa). Las portadas que faltan se piden en paralelo
+    con un pool de hilos acotado que comparte una ``requests.Session``.
+    """
+
+    def __init__(
+        self,
+        endpoint=OEMBED_URL,
+        max_workers=MAX_WORKERS,
+        cache_size=CACHE_SIZE,
+        ttl=COVER_TTL,
+        miss_ttl=MISS_TTL,
+        timeout=5,
+    ):
+        self.endpoint = endpoint
+        self.max_workers = max_workers
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self.timeout = timeout
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="covers"
+                )
+            return self._executor
+
+    def _expired(self, url, fetched, now):
+        return now - fetched > (self.ttl if url else self.miss_ttl)
+
+    # ===== CACHÉ EN MEMORIA =====
+    def _remember(self, track_id, url, fetched):
+        with self._lock:
+            self._memory[track_id] = (url, fetched)
+            self._memory.move_to_end(track_id)
+            while len(self._memory) > self.cache_size:
+                self._memory.popitem(last=False)
+
+    def _from_memory(self, track_ids, now):
+        found = {}
+        with self._lock:
+            for track_id in track_ids:
+                entry = self._memory.get(track_id)
+                if entry is not None and not self._expired(*entry, now):
+                    self._memory.move_to_end(track_id)
+                    found[track_id] = entry[0]
+        return found
+
+    # ===== CACHÉ EN SQLITE =====
+    def _from_db(self, track_ids, now):
+        if not track_ids:
+            return {}
+        placeholders = ",".join("?" * len(track_ids))
+        with get_pool().connection() as conn:
+            rows = conn.execute(
+                f"SELECT track_id, url, fetched FROM album_covers "
+                f"WHERE track_id IN ({placeholders})",
+                list(track_ids),
+            ).fetchall()
+        found = {}
+        for track_id, url, fetched in rows:
+            if not self._expired(url, fetched, now):
+                self._remember(track_id, url, fetched)
+                found[track_id] = url
+        return found
+
+    def _store(self, results, fetched):
+        with get_pool().transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO album_covers (track_id, url, fetched) "
+                "VALUES (?, ?, ?)",
+                [(track_id, url, fetched) for track_id, url in results.items()],
+            )
+
+    # ===== RED =====
+    def fetch(self, track_id):
+        """Pide la portada al endpoint oEmbed ("" si no hay o falla)"""
+        try:
+            resp = self.session.get(
+                self.endpoint,
+                params={"url": f"https://open.spotify.com/track/{track_id}"},
+                timeout=self.timeout,
+            )
+            if resp.ok:
+                return resp.json().get("thumbnail_url", "") or ""
+        except (requests.RequestException, ValueError):
+            pass
+        return ""
+
+    def resolve(self, track_ids):
+        """Diccionario ``track_id -> url`` (cadena vacía si no hay portada)"""
+        track_ids = list(dict.fromkeys(track_ids))
+        now = time.time()
+        covers = self._from_memory(track_ids, now)
+        missing = [track_id for track_id in track_ids if track_id not in covers]
+        covers.update(self._from_db(missing, now))
+        missing = [track_id for track_id in missing if track_id not in covers]
+
+        if missing:
+            urls = list(self._pool().map(self.fetch, missing))
+            results = dict(zip(missing, urls))
+            fetched = time.time()
+            for track_id, url in results.items():
+                self._remember(track_id, url, fetched)
+            self._store(results, fetched)
+            covers.update(results)
+        return {track_id: covers[track_id] for track_id in track_ids}
+
+    def get(self, track_id):
+        return self.resolve([track_id])[track_id]
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+        self.session.close()
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def get_cover_resolver():
+    """Resolvedor compartido por todas las sesiones del proceso"""
+    global _resolver
+    with _resolver_lock:
+        if _resolver is None:
+            _resolver = CoverResolver()
+        return _resolver
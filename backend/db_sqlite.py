@@ -1,15 +1,117 @@
 import sqlite3
 import json
-import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
 
 DB_PATH = "usuarios.db"
+POOL_SIZE = 8
+PROFILE_CACHE_TTL = 30  # segundos; acota lo desfasada que puede estar otra instancia
+
+LIKE = 1
+DISLIKE = -1
+CLEAR = 0
+
+
+class ConnectionPool:
+    """
+    Pool de conexiones SQLite reutilizables entre hilos (sesiones de Streamlit).
+
+    Todas las conexiones usan WAL, de modo que los lectores no bloquean al
+    escritor, y un busy_timeout para esperar en lugar de fallar con
+    "database is locked".
+    """
+
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path, timeout=30, check_same_thread=False, isolation_level=None
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            conn = self._connect() if create else self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    @contextmanager
+    def transaction(self):
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                # Si falla el COMMIT (p. ej. SQLITE_BUSY) la transacción sigue
+                # abierta: se deshace antes de devolver la conexión al pool
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created = 0
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_profile_cache = {}
+_cache_lock = threading.Lock()
+_initialized = set()  # rutas de BD ya inicializadas en este proceso
+_init_lock = threading.Lock()
+
+
+def get_pool():
+    """Pool compartido del proceso (se recrea si cambia DB_PATH)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.path != DB_PATH:
+            if _pool is not None:
+                _pool.close()
+            _pool = ConnectionPool(DB_PATH)
+        return _pool
+
+
+def _invalidate(user_id):
+    with _cache_lock:
+        _profile_cache.pop(user_id, None)
 
 
 def init_db():
-    if not os.path.exists(DB_PATH):
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute(
+    """
+    Crea el esquema y migra el feedback antiguo una sola vez por proceso (y
+    ruta de BD): los reruns de Streamlit no vuelven a tomar el lock de
+    escritura.
+    """
+    if DB_PATH in _initialized:
+        return
+    with _init_lock, get_pool().transaction() as conn:
+        conn.execute(
             """
             CREATE TABLE IF NOT EXISTS user_profiles (
                 id TEXT PRIMARY KEY,
@@ -20,35 +122,207 @@ def init_db():
             )
         """
         )
-        conn.commit()
-        conn.close()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS feedback (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                track_id TEXT NOT NULL,
+                polarity INTEGER NOT NULL,
+                ts TEXT NOT NULL DEFAULT (datetime('now'))
+            )
+        """
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_feedback_user ON feedback (user_id, track_id)"
+        )
+        # Sumas y recuentos del perfil en espacio escalado (ver backend.user_profile)
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS profile_vectors (
+                user_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                version TEXT NOT NULL,
+                total BLOB NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (user_id, kind)
+            )
+        """
+        )
+        # Caché persistente de portadas (ver backend.covers); url vacía = fallo
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS album_covers (
+                track_id TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                fetched REAL NOT NULL
+            )
+        """
+        )
+        # Biblioteca de Spotify sincronizada (ver backend.library_sync)
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS saved_tracks (
+                user_id TEXT NOT NULL,
+                track_id TEXT NOT NULL,
+                track_name TEXT,
+                artist_name TEXT,
+                added_at TEXT NOT NULL,
+                PRIMARY KEY (user_id, track_id)
+            )
+        """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS library_sync (
+                user_id TEXT PRIMARY KEY,
+                total INTEGER NOT NULL,
+                latest TEXT,
+                synced_at TEXT NOT NULL
+            )
+        """
+        )
+        # Nivel persistente opcional de la caché de resultados (backend.result_cache)
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS recommendation_cache (
+                key TEXT PRIMARY KEY,
+                payload BLOB NOT NULL,
+                created REAL NOT NULL
+            )
+        """
+        )
+        _migrate_json_feedback(conn)
+    _initialized.add(DB_PATH)
 
 
-def save_user_profile(user_id, email, likes, dislikes):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute(
-        "REPLACE INTO user_profiles (id, email, likes, dislikes, last_update) VALUES (?, ?, ?, ?, datetime('now'))",
-        (user_id, email, json.dumps(likes), json.dumps(dislikes)),
+def _migrate_json_feedback(conn):
+    """Pasa los likes/dislikes guardados como JSON a la tabla feedback"""
+    rows = conn.execute(
+        "SELECT id, likes, dislikes, last_update FROM user_profiles "
+        "WHERE likes IS NOT NULL OR dislikes IS NOT NULL"
+    ).fetchall()
+    for user_id, likes, dislikes, last_update in rows:
+        events = [(track_id, LIKE) for track_id in json.loads(likes or "[]")]
+        events += [(track_id, DISLIKE) for track_id in json.loads(dislikes or "[]")]
+        conn.executemany(
+            "INSERT INTO feedback (user_id, track_id, polarity, ts) "
+            "VALUES (?, ?, ?, COALESCE(?, datetime('now')))",
+            [(user_id, track_id, polarity, last_update) for track_id, polarity in events],
+        )
+        conn.execute(
+            "UPDATE user_profiles SET likes = NULL, dislikes = NULL WHERE id = ?",
+            (user_id,),
+        )
+
+
+def _insert_feedback(conn, user_id, track_id, polarity):
+    """Añade el evento y devuelve la polaridad vigente antes de él (o None)"""
+    previous = conn.execute(
+        "SELECT polarity FROM feedback WHERE user_id = ? AND track_id = ? "
+        "ORDER BY id DESC LIMIT 1",
+        (user_id, track_id),
+    ).fetchone()
+    conn.execute(
+        "INSERT INTO feedback (user_id, track_id, polarity) VALUES (?, ?, ?)",
+        (user_id, track_id, polarity),
     )
-    conn.commit()
-    conn.close()
+    return previous[0] if previous else None
 
 
-def load_user_profile(user_id):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute(
-        "SELECT email, likes, dislikes, last_update FROM user_profiles WHERE id=?",
+def add_feedback(user_id, track_id, polarity):
+    """Registra un 👍 (1), 👎 (-1) o su retirada (0) como escritura de solo-añadir"""
+    with get_pool().transaction() as conn:
+        _insert_feedback(conn, user_id, track_id, polarity)
+    _invalidate(user_id)
+
+
+def _current_feedback(conn, user_id):
+    rows = conn.execute(
+        """
+        SELECT track_id, polarity FROM feedback
+        WHERE id IN (
+            SELECT MAX(id) FROM feedback WHERE user_id = ? GROUP BY track_id
+        )
+        ORDER BY id
+    """,
         (user_id,),
-    )
-    row = c.fetchone()
-    conn.close()
-    if row:
-        return {
-            "email": row[0],
-            "likes": json.loads(row[1]),
-            "dislikes": json.loads(row[2]),
-            "last_update": row[3],
+    ).fetchall()
+    likes = [track_id for track_id, polarity in rows if polarity == LIKE]
+    dislikes = [track_id for track_id, polarity in rows if polarity == DISLIKE]
+    return likes, dislikes
+
+
+def save_user_profile(user_id, email, likes, dislikes):
+    """Guarda el perfil añadiendo solo los cambios respecto al estado actual"""
+    with get_pool().transaction() as conn:
+        conn.execute(
+            """
+            INSERT INTO user_profiles (id, email, last_update)
+            VALUES (?, ?, datetime('now'))
+            ON CONFLICT(id) DO UPDATE SET
+                email = excluded.email, last_update = excluded.last_update
+        """,
+            (user_id, email),
+        )
+        current_likes, current_dislikes = _current_feedback(conn, user_id)
+        current = {track_id: LIKE for track_id in current_likes}
+        current.update({track_id: DISLIKE for track_id in current_dislikes})
+        wanted = {track_id: LIKE for track_id in likes}
+        wanted.update({track_id: DISLIKE for track_id in dislikes})
+
+        events = [
+            (user_id, track_id, polarity)
+            for track_id, polarity in wanted.items()
+            if current.get(track_id) != polarity
+        ]
+        events += [
+            (user_id, track_id, CLEAR) for track_id in current if track_id not in wanted
+        ]
+        conn.executemany(
+            "INSERT INTO feedback (user_id, track_id, polarity) VALUES (?, ?, ?)",
+            events,
+        )
+    _invalidate(user_id)
+
+
+def load_user_profile(user_id):
+    """Lectura con caché: solo va a SQLite si el perfil cambió o caducó"""
+    now = time.monotonic()
+    with _cache_lock:
+        cached = _profile_cache.get(user_id)
+    if cached is not None and now - cached[0] < PROFILE_CACHE_TTL:
+        return _copy_profile(cached[1])
+
+    with get_pool().connection() as conn:
+        row = conn.execute(
+            "SELECT email, last_update FROM user_profiles WHERE id=?", (user_id,)
+        ).fetchone()
+        likes, dislikes = _current_feedback(conn, user_id)
+        last_feedback = conn.execute(
+            "SELECT MAX(ts) FROM feedback WHERE user_id=?", (user_id,)
+        ).fetchone()[0]
+
+    profile = None
+    if row or likes or dislikes:
+        updates = [value for value in (row[1] if row else None, last_feedback) if value]
+        profile = {
+            "email": row[0] if row else "",
+            "likes": likes,
+            "dislikes": dislikes,
+            "last_update": max(updates, default=None),
         }
-    return None
+    with _cache_lock:
+        _profile_cache[user_id] = (now, profile)
+    return _copy_profile(profile)
+
+
+def _copy_profile(profile):
+    # Las listas se copian: la app las modifica en session_state
+    if profile is None:
+        return None
+    return {
+        **profile,
+        "likes": list(profile["likes"]),
+        "dislikes": list(profile["dislikes"]),
+    }
@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+STORE_DIR = ".catalog_store"
+STORE_FORMAT = 1
+
+
+def catalog_version(df, attr_cols):
+    """Huella estable del catálogo: cambia si cambian filas, ids o atributos."""
+    cols = [col for col in ["track_id", *attr_cols] if col in df.columns]
+    digest = hashlib.sha1()
+    digest.update(f"{STORE_FORMAT}|{len(df)}|{','.join(cols)}".encode())
+    digest.update(pd.util.hash_pandas_object(df[cols], index=True).values.tobytes())
+    return digest.hexdigest()[:16]
+
+
+def _atomic_save(path, array):
+    tmp_fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".npy")
+    with os.fdopen(tmp_fd, "wb") as fh:
+        np.save(fh, array)
+    os.replace(tmp_path, path)
+
+
+class FeatureStore:
+    """
+    Matriz de características escalada (float32) de un catálogo concreto.
+
+    Se ajusta el StandardScaler una vez por versión del catálogo y se persiste
+    en disco como .npy, de modo que las peticiones solo indexan filas del
+    memmap en lugar de reescalar todo el catálogo.
+    """
+
+    def __init__(self, path, index, attr_cols, mean, scale, version):
+        self.path = path
+        self.index = index
+        self.attr_cols = list(attr_cols)
+        self.mean = mean
+        self.scale = scale
+        self.version = version
+        self.features = np.load(os.path.join(path, "features.npy"), mmap_mode="r")
+
+    def __len__(self):
+        return self.features.shape[0]
+
+    def transform(self, frame):
+        """Escala filas externas (favoritas, likes...) con los parámetros guardados"""
+        values = frame[self.attr_cols].to_numpy(dtype=np.float32)
+        return (values - self.mean) / self.scale
+
+    def rows(self, frame):
+        """Posiciones en el catálogo de las filas de un subconjunto filtrado"""
+        rows = self.index.get_indexer(frame.index)
+        if (rows < 0).any():
+            raise ValueError("El DataFrame contiene filas que no pertenecen al catálogo")
+        return rows
+
+    def take(self, rows):
+        return np.asarray(self.features[rows])
+
+    # ===== ARTEFACTOS DERIVADOS =====
+    def has_array(self, name):
+        return os.path.exists(os.path.join(self.path, f"{name}.npy"))
+
+    def load_array(self, name, mmap=True):
+        return np.load(
+            os.path.join(self.path, f"{name}.npy"), mmap_mode="r" if mmap else None
+        )
+
+    def save_array(self, name, array):
+        _atomic_save(os.path.join(self.path, f"{name}.npy"), array)
+
+
+def build_feature_store(df, attr_cols, store_dir=STORE_DIR, version=None):
+    """Ajusta el escalado sobre todo el catálogo y lo persiste en disco"""
+    version = version or catalog_version(df, attr_cols)
+    values = df[attr_cols].to_numpy(dtype=np.float64)
+    mean = values.mean(axis=0)
+    scale = values.std(axis=0)
+    scale[scale == 0] = 1.0  # Igual que StandardScaler con columnas constantes
+
+    os.makedirs(store_dir, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(dir=store_dir, prefix=f".{version}-")
+    try:
+        scaled = ((values - mean) / scale).astype(np.float32)
+        np.save(os.path.join(tmp_path, "features.npy"), scaled)
+        del scaled
+        with open(os.path.join(tmp_path, "meta.json"), "w") as fh:
+            json.dump(
+                {
+                    "version": version,
+                    "format": STORE_FORMAT,
+                    "n_rows": len(df),
+                    "attr_cols": list(attr_cols),
+                    "mean": mean.tolist(),
+                    "scale": scale.tolist(),
+                },
+                fh,
+            )
+        final_path = os.path.join(store_dir, version)
+        if os.path.exists(final_path):
+            shutil.rmtree(final_path)
+        os.replace(tmp_path, final_path)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+    # Eliminar versiones antiguas del catálogo
+    for entry in os.listdir(store_dir):
+        if entry != version and not entry.startswith("."):
+            shutil.rmtree(os.path.join(store_dir, entry), ignore_errors=True)
+
+    return _open(final_path, df.index, attr_cols)
+
+
+def _open(path, index, attr_cols):
+    with open(os.path.join(path, "meta.json")) as fh:
+        meta = json.load(fh)
+    if meta["attr_cols"] != list(attr_cols) or meta["n_rows"] != len(index):
+        return None
+    return FeatureStore(
+        path,
+        index,
+        meta["attr_cols"],
+        np.asarray(meta["mean"], dtype=np.float32),
+        np.asarray(meta["scale"], dtype=np.float32),
+        meta["version"],
+    )
+
+
+def load_feature_store(df, attr_cols, store_dir=STORE_DIR, version=None):
+    """Abre el store de esta versión del catálogo o lo reconstruye si no existe"""
+    version = version or catalog_version(df, attr_cols)
+    path = os.path.join(store_dir, version)
+    if os.path.exists(os.path.join(path, "meta.json")):
+        try:
+            store = _open(path, df.index, attr_cols)
+        except (OSError, ValueError):
+            store = None
+        if store is not None:
+            return store
+    return build_feature_store(df, attr_cols, store_dir=store_dir, version=version)
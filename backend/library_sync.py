@@ -0,0 +1,146 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from backend.db_sqlite import get_pool
+
+PAGE_SIZE = 50  # máximo que admite /me/tracks por página
+MAX_WORKERS = 4
+REQUESTS_PER_SECOND = 5
+
+
+class RateLimiter:
+    """Reparte las peticiones a intervalos regulares entre todos los hilos"""
+
+    def __init__(self, rate=REQUESTS_PER_SECOND):
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+def _rows(user_id, items):
+    rows = []
+    for item in items:
+        track = item.get("track")
+        # Los ficheros locales y las pistas retiradas no tienen id
+        if not track or not track.get("id"):
+            continue
+        rows.append(
+            (
+                user_id,
+                track["id"],
+                track["name"],
+                ", ".join([artist["name"] for artist in track["artists"]]),
+                item["added_at"],
+            )
+        )
+    return rows
+
+
+def _fetch_page(sp, limiter, offset):
+    limiter.acquire()
+    return sp.current_user_saved_tracks(limit=PAGE_SIZE, offset=offset)
+
+
+def _store(user_id, rows, total, latest, replace=False):
+    with get_pool().transaction() as conn:
+        if replace:
+            conn.execute("DELETE FROM saved_tracks WHERE user_id = ?", (user_id,))
+        conn.executemany(
+            "INSERT OR REPLACE INTO saved_tracks "
+            "(user_id, track_id, track_name, artist_name, added_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO library_sync (user_id, total, latest, synced_at) "
+            "VALUES (?, ?, ?, datetime('now'))",
+            (user_id, total, latest),
+        )
+
+
+def _sync_state(user_id):
+    with get_pool().connection() as conn:
+        return conn.execute(
+            "SELECT total, latest FROM library_sync WHERE user_id = ?", (user_id,)
+        ).fetchone()
+
+
+def _latest(items, default=None):
+    return max((item["added_at"] for item in items), default=default)
+
+
+def _full_sync(sp, user_id, limiter, max_workers, first_page=None):
+    """Descarga toda la biblioteca repartiendo las páginas por offset entre hilos"""
+    first_page = first_page or _fetch_page(sp, limiter, 0)
+    offsets = range(PAGE_SIZE, first_page["total"], PAGE_SIZE)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pages = list(pool.map(lambda offset: _fetch_page(sp, limiter, offset), offsets))
+    rows = []
+    for page in [first_page, *pages]:
+        rows += _rows(user_id, page["items"])
+    _store(
+        user_id,
+        rows,
+        first_page["total"],
+        _latest(first_page["items"], default=""),
+        replace=True,
+    )
+    return len(rows)
+
+
+def sync_saved_tracks(sp, user_id, max_workers=MAX_WORKERS, rate=REQUESTS_PER_SECOND):
+    """
+    Sincroniza las canciones guardadas del usuario con la tabla saved_tracks.
+
+    La primera vez descarga toda la biblioteca en paralelo. Después solo se
+    leen las páginas más recientes (la API las ordena por ``added_at``
+    descendente) hasta llegar a lo ya sincronizado. Si el total de la API no
+    cuadra con el anterior más lo nuevo (p. ej. el usuario quitó canciones)
+    se resincroniza entera. Devuelve el número de canciones descargadas.
+    """
+    limiter = RateLimiter(rate)
+    state = _sync_state(user_id)
+    if state is None:
+        return _full_sync(sp, user_id, limiter, max_workers)
+    total, latest = state
+
+    new_items = []
+    offset = 0
+    first_page = page = _fetch_page(sp, limiter, 0)
+    while True:
+        fresh = [item for item in page["items"] if item["added_at"] > latest]
+        new_items += fresh
+        if len(fresh) < len(page["items"]) or not page["next"]:
+            break
+        offset += PAGE_SIZE
+        page = _fetch_page(sp, limiter, offset)
+
+    if total + len(new_items) != first_page["total"]:
+        return _full_sync(sp, user_id, limiter, max_workers, first_page=first_page)
+    rows = _rows(user_id, new_items)
+    _store(user_id, rows, first_page["total"], _latest(new_items, latest))
+    return len(rows)
+
+
+def load_saved_tracks(user_id):
+    """Biblioteca local del usuario con las columnas del CSV de Spotify"""
+    with get_pool().connection() as conn:
+        rows = conn.execute(
+            "SELECT track_name, artist_name, track_id, added_at FROM saved_tracks "
+            "WHERE user_id = ? ORDER BY added_at DESC",
+            (user_id,),
+        ).fetchall()
+    return pd.DataFrame(
+        rows, columns=["Track name", "Artist name", "Spotify - id", "added_at"]
+    )
@@ -1,17 +1,127 @@
+import difflib
+
+import numpy as np
 import pandas as pd
 
+from backend.catalog import Catalog
+
+_FEAT_RE = r"[\(\[]?\s*\b(?:feat|ft|featuring)\b\.?.*$"
+_ARTIST_SPLIT_RE = r"\s*(?:;|,|&)\s*"
+
 
-def match_favs_with_features(favs_df, tracks_df):
-    # Une por Spotify ID (track_id en HuggingFace dataset)
-    merged = pd.merge(
-        favs_df, tracks_df, left_on="Spotify - id", right_on="track_id", how="inner"
+def normalize_text(values):
+    """Minúsculas, sin acentos, sin "feat. ..." ni signos de puntuación"""
+    text = pd.Series(values, dtype="object").fillna("").astype(str)
+    text = (
+        text.str.normalize("NFKD")
+        .str.encode("ascii", "ignore")
+        .str.decode("ascii")
+        .str.lower()
+        .str.replace(_FEAT_RE, "", regex=True)
+        .str.replace(r"[^\w\s]", " ", regex=True)
+        .str.split()
+        .str.join(" ")
     )
-    if merged.empty:
-        merged = pd.merge(
-            favs_df,
-            tracks_df,
-            left_on=["Track name", "Artist name"],
-            right_on=["track_name", "artists"],
-            how="inner",
+    return text.to_numpy(dtype=object)
+
+
+def normalize_artist(values):
+    """Artista principal normalizado ("A;B", "A, B" y "A feat. B" -> "a")"""
+    first = pd.Series(values, dtype="object").fillna("").astype(str)
+    first = first.str.split(_ARTIST_SPLIT_RE, n=1, regex=True).str[0]
+    return normalize_text(first)
+
+
+def _normalize_column(values, normalize):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # Columna codificada como diccionario: cada valor distinto se normaliza una vez
+        categories = normalize(values.cat.categories)
+        codes = values.cat.codes.to_numpy()
+        return np.where(codes >= 0, categories[codes], "")
+    return normalize(values)
+
+
+class MatchIndex:
+    """
+    Índices hash del catálogo para emparejar la biblioteca del usuario:
+    ``track_id`` -> fila y (título, artista principal) normalizados -> fila.
+    Para el emparejamiento difuso se agrupan los títulos por artista, de modo
+    que cada consulta solo se compara con las canciones de su bloque.
+
+    ``tracks_df`` puede ser un ``Catalog``, cuyo ``track_id_map`` ya cubre los
+    ids de todas las versiones.
+    """
+
+    def __init__(self, tracks_df, track_id_map=None):
+        if isinstance(tracks_df, Catalog):
+            if track_id_map is None:
+                track_id_map = tracks_df.track_id_map
+            tracks_df = tracks_df.tracks
+        positions = np.arange(len(tracks_df))
+        self.by_id = dict(zip(tracks_df["track_id"].to_numpy(), positions))
+        if track_id_map is not None:
+            # Ids de versiones descartadas al canonicalizar el catálogo
+            for track_id, row in track_id_map.items():
+                self.by_id.setdefault(track_id, int(row))
+
+        titles = _normalize_column(tracks_df["track_name"], normalize_text)
+        artists = _normalize_column(tracks_df["artists"], normalize_artist)
+        self.by_name = {}
+        self.blocks = {}
+        for title, artist, position in zip(titles, artists, positions):
+            # La primera aparición gana (el catálogo canónico va por popularidad)
+            self.by_name.setdefault((title, artist), position)
+            self.blocks.setdefault(artist, {}).setdefault(title, position)
+
+    def lookup(self, track_id, title, artist, fuzzy=False, cutoff=0.85):
+        """Cadena de respaldo por pista: id -> nombre normalizado -> difuso"""
+        position = self.by_id.get(track_id)
+        if position is not None:
+            return position
+        position = self.by_name.get((title, artist))
+        if position is not None:
+            return position
+        if fuzzy and artist in self.blocks:
+            block = self.blocks[artist]
+            close = difflib.get_close_matches(title, block.keys(), n=1, cutoff=cutoff)
+            if close:
+                return block[close[0]]
+        return -1
+
+    def match(self, favs_df, fuzzy=False, cutoff=0.85):
+        """Fila del catálogo de cada favorita (-1 si no se encuentra)"""
+        n = len(favs_df)
+        ids = favs_df["Spotify - id"] if "Spotify - id" in favs_df else [None] * n
+        titles = normalize_text(favs_df["Track name"]) if "Track name" in favs_df else [""] * n
+        artists = (
+            normalize_artist(favs_df["Artist name"]) if "Artist name" in favs_df else [""] * n
+        )
+        return np.array(
+            [
+                self.lookup(track_id, title, artist, fuzzy=fuzzy, cutoff=cutoff)
+                for track_id, title, artist in zip(ids, titles, artists)
+            ],
+            dtype=np.int64,
         )
-    return merged
+
+
+def build_match_index(tracks_df, track_id_map=None):
+    return MatchIndex(tracks_df, track_id_map=track_id_map)
+
+
+def match_favs_with_features(favs_df, tracks_df, index=None, fuzzy=False):
+    # Une por Spotify ID (track_id en HuggingFace dataset) y, pista a pista,
+    # recurre al título/artista normalizados (y opcionalmente difusos)
+    if index is None:
+        index = build_match_index(tracks_df)
+    if isinstance(tracks_df, Catalog):
+        tracks_df = tracks_df.tracks
+    positions = index.match(favs_df, fuzzy=fuzzy)
+    found = positions >= 0
+    return pd.concat(
+        [
+            favs_df[found].reset_index(drop=True),
+            tracks_df.iloc[positions[found]].reset_index(drop=True),
+        ],
+        axis=1,
+    )
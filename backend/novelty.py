@@ -0,0 +1,43 @@
+import numpy as np
+from sklearn.ensemble import IsolationForest
+
+CHUNK_SIZE = 100_000
+
+
+def normalize_novelty(scores):
+    """Convierte la salida de IsolationForest a [0,1] (más alto = más novedoso)"""
+    scores = np.asarray(scores, dtype=np.float32)
+    span = scores.max() - scores.min()
+    if span <= 0:
+        return np.full(len(scores), 0.5, dtype=np.float32)
+    return (scores - scores.min()) / span
+
+
+def subset_novelty(ds_scaled, random_state=42):
+    """Novedad relativa al subconjunto filtrado (se ajusta en cada petición)"""
+    iso_forest = IsolationForest(contamination=0.1, random_state=random_state)
+    iso_forest.fit(ds_scaled)
+    return normalize_novelty(iso_forest.decision_function(ds_scaled))
+
+
+def build_novelty_scores(store, random_state=42):
+    """Ajusta IsolationForest sobre todo el catálogo y guarda una columna float32"""
+    features = store.features
+    iso_forest = IsolationForest(contamination=0.1, random_state=random_state)
+    iso_forest.fit(features)
+
+    scores = np.empty(features.shape[0], dtype=np.float32)
+    for start in range(0, features.shape[0], CHUNK_SIZE):
+        chunk = np.asarray(features[start : start + CHUNK_SIZE])
+        scores[start : start + len(chunk)] = iso_forest.decision_function(chunk)
+
+    scores = normalize_novelty(scores)
+    store.save_array("novelty", scores)
+    return scores
+
+
+def load_novelty_scores(store, **build_kwargs):
+    """Columna de novedad global de esta versión del catálogo (la construye si falta)"""
+    if store.has_array("novelty"):
+        return store.load_array("novelty")
+    return build_novelty_scores(store, **build_kwargs)
@@ -4,56 +4,174 @@ from sklearn.preprocessing import StandardScaler, MinMaxScaler
 from sklearn.metrics.pairwise import cosine_similarity
 from sklearn.cluster import KMeans
 from sklearn.decomposition import PCA
-from sklearn.ensemble import IsolationForest
-from multiprocessing import Pool, cpu_count
+from backend.scoring import get_scoring_engine
+from backend.novelty import subset_novelty
+from backend.tracing import NULL_TRACER
+from backend.streaming import (
+    CHUNK_SIZE,
+    ChunkFilter,
+    ParquetTracks,
+    has_catalog_tables,
+    stream_top_candidates,
+)
+from backend.catalog import Catalog
+from backend.catalog_index import alias_genre_rows, derive_release_year, genre_contains
 import warnings
 
 warnings.filterwarnings("ignore")
 
 
-def compute_similarity_chunk(args):
-    chunk, fav_mean = args
-    return cosine_similarity(chunk, fav_mean).flatten()
-
-
 def parallel_similarity_multicore(ds_scaled, fav_mean, n_workers=None):
-    if n_workers is None:
-        n_workers = min(cpu_count(), 8)
-
-    chunk_size = max(1, int(np.ceil(ds_scaled.shape[0] / n_workers)))
-    chunks = [
-        ds_scaled[i : i + chunk_size] for i in range(0, ds_scaled.shape[0], chunk_size)
-    ]
+    """
+    Compatibilidad: delega en el motor de similitud persistente, que decide
+    por sí mismo si ejecutar en serie o en paralelo (``n_workers`` se ignora).
+    """
+    return get_scoring_engine().similarity(ds_scaled, fav_mean)
 
-    with Pool(processes=n_workers) as pool:
-        results = pool.map(
-            compute_similarity_chunk, [(chunk, fav_mean) for chunk in chunks]
-        )
 
-    return np.concatenate(results)
+def filter_by_genre(df, genre, genre_index=None):
+    """Filtra por uno o varios géneros ("pop, rock"), coincidencia por subcadena"""
+    if not genre:
+        return df
+    if genre_index is not None:
+        return genre_index.filter(df, genre)
+    if "track_genre" in df.columns:
+        return df[genre_contains(df["track_genre"], genre)]
+    return df
 
 
-def filter_by_genre(df, genre):
-    if genre and "track_genre" in df.columns:
-        return df[df["track_genre"].str.contains(genre, case=False, na=False)]
-    return df
+def _unit_rows(matrix):
+    matrix = np.asarray(matrix, dtype=np.float64)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
 
 
 def calculate_diversity_score(recommendations, features):
-    """Calcula puntuación de diversidad para evitar recomendaciones muy similares entre sí"""
+    """
+    Calcula puntuación de diversidad para evitar recomendaciones muy similares entre sí.
+
+    Equivale a 1 - media de la similitud coseno con el resto de candidatas,
+    pero sin bucles: la suma de cada fila de la matriz de Gram normalizada es
+    el producto de la fila por la suma de todos los vectores unitarios.
+    """
     if len(recommendations) < 2:
         return np.ones(len(recommendations))
 
-    rec_features = recommendations[features].values
-    diversity_scores = []
+    unit = _unit_rows(recommendations[features].values)
+    self_sims = np.einsum("ij,ij->i", unit, unit)
+    other_sims = unit @ unit.sum(axis=0) - self_sims
+    return 1 - other_sims / (len(unit) - 1)
+
+
+def _dense_codes(codes):
+    return np.unique(np.asarray(codes), return_inverse=True)[1].ravel()
 
-    for i, track in enumerate(rec_features):
-        others = np.delete(rec_features, i, axis=0)
-        similarities = cosine_similarity([track], others).flatten()
-        diversity = 1 - np.mean(similarities)
-        diversity_scores.append(diversity)
 
-    return np.array(diversity_scores)
+def _group_ranks(codes):
+    """Rango de cada posición dentro de su grupo, respetando el orden recibido"""
+    order = np.argsort(codes, kind="stable")
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    group_start = np.repeat(starts, np.diff(np.r_[starts, len(codes)]))
+    ranks = np.empty(len(codes), dtype=np.int64)
+    ranks[order] = np.arange(len(codes)) - group_start
+    return ranks
+
+
+def _backfill(order, selected, k):
+    """Completa hasta ``k`` con las mejores posiciones descartadas por los topes"""
+    if len(selected) >= k:
+        return selected[:k]
+    rest = order[~np.isin(order, selected)]
+    return np.concatenate([selected, rest[: k - len(selected)]])
+
+
+def capped_topk(scores, k, groups=(), caps=()):
+    """
+    Top-k por puntuación con un máximo de elementos por grupo (género, artista,
+    álbum...). ``groups`` son arrays de códigos y ``caps`` sus topes (None = sin
+    tope). Equivale al recorrido voraz por orden de puntuación, pero cada ronda
+    es vectorizada: se descartan de golpe las posiciones cuyo tope lo agotan
+    filas ya aceptadas. Si los topes impiden llenar ``k`` huecos se completa
+    con las mejores descartadas.
+    """
+    order = np.argsort(-np.asarray(scores, dtype=np.float64), kind="stable")
+    k = min(k, len(order))
+    constraints = [
+        (_dense_codes(codes), cap)
+        for codes, cap in zip(groups, caps)
+        if cap is not None
+    ]
+    alive = order
+    while constraints:
+        checks = []
+        for codes, cap in constraints:
+            alive_codes = codes[alive]
+            ranks = _group_ranks(alive_codes)
+            checks.append((alive_codes, ranks, cap))
+        failing = np.zeros(len(alive), dtype=bool)
+        for _, ranks, cap in checks:
+            failing |= ranks >= cap
+        if not failing.any():
+            break
+        first_fail = int(np.argmax(failing))
+        if first_fail >= k:
+            break
+
+        # Una fila se descarta en firme si las que agotan su tope están todas
+        # antes del primer fallo (es decir, ya están aceptadas)
+        rejected = np.zeros(len(alive), dtype=bool)
+        positions = np.arange(len(alive))
+        for alive_codes, ranks, cap in checks:
+            last_allowed = np.full(alive_codes.max() + 1, -1, dtype=np.int64)
+            at_cap = ranks == cap - 1
+            last_allowed[alive_codes[at_cap]] = positions[at_cap]
+            rejected |= (ranks >= cap) & (last_allowed[alive_codes] < first_fail)
+        alive = alive[~rejected]
+
+    return _backfill(order, alive[:k], k)
+
+
+def mmr_rerank(relevance, features, k, lambda_=0.7, groups=(), caps=()):
+    """
+    Maximal Marginal Relevance: elige ``k`` posiciones equilibrando relevancia
+    y parecido con las ya elegidas. La similitud máxima con la selección se
+    actualiza incrementalmente (un producto matriz-vector por paso).
+
+    Admite los mismos topes por grupo que ``capped_topk``.
+    """
+    relevance = np.asarray(relevance, dtype=np.float64)
+    k = min(k, len(relevance))
+    unit = _unit_rows(features)
+    max_sim = np.full(len(relevance), -np.inf)
+    available = np.ones(len(relevance), dtype=bool)
+    constraints = [
+        (_dense_codes(codes), cap)
+        for codes, cap in zip(groups, caps)
+        if cap is not None
+    ]
+    counts = [np.zeros(codes.max() + 1, dtype=np.int64) for codes, _ in constraints]
+    if any(cap <= 0 for _, cap in constraints):
+        available[:] = False
+    selected = []
+
+    for _ in range(k):
+        if not available.any():
+            break
+        redundancy = np.where(np.isfinite(max_sim), max_sim, 0.0)
+        mmr = lambda_ * relevance - (1 - lambda_) * redundancy
+        mmr[~available] = -np.inf
+        best = int(np.argmax(mmr))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_sim, unit @ unit[best], out=max_sim)
+        for (codes, cap), count in zip(constraints, counts):
+            count[codes[best]] += 1
+            if count[codes[best]] >= cap:
+                available &= codes != codes[best]
+
+    selected = np.array(selected, dtype=np.int64)
+    return _backfill(np.argsort(-relevance, kind="stable"), selected, k)
 
 
 def hybrid_recommendation_score(
@@ -92,137 +210,153 @@ def hybrid_recommendation_score(
     return hybrid_score
 
 
-def get_advanced_recommendations(
-    user_favs_df,
+def _positions_in(index, frame):
+    """Posiciones de las filas de ``frame`` en un catálogo indexado (None = idénticas)"""
+    if index.equals(frame.index):
+        return None
+    positions = index.get_indexer(frame.index)
+    if (positions < 0).any():
+        raise ValueError("El DataFrame contiene filas que no pertenecen al catálogo")
+    return positions
+
+
+def _restrict(mask, bitmap, index, frame):
+    """Interseca la máscara de ``frame`` con un bitmap sobre el catálogo"""
+    positions = _positions_in(index, frame)
+    mask &= bitmap if positions is None else bitmap[positions]
+
+
+def filter_catalog_rows(
     tracks_df,
-    attr_cols,
-    topn=20,
     pop_min=None,
     year_min=None,
     year_max=None,
     exclude_ids=None,
-    liked_tracks=None,
-    disliked_tracks=None,
-    use_clustering=True,
-    diversity_weight=0.3,
-    novelty_boost=True,
+    genre=None,
+    genre_index=None,
+    popularity_index=None,
+    year_index=None,
+    track_id_map=None,
+    genre_aliases=None,
 ):
     """
-    Sistema de recomendación avanzado con múltiples técnicas de ML:
-    - Clustering para encontrar micro-géneros
-    - Análisis de componentes principales (PCA)
-    - Filtrado colaborativo híbrido
-    - Detección de outliers para novedad
-    - Balanceado de diversidad vs similitud
+    Posiciones (iloc) de ``tracks_df`` que pasan los filtros, como intersección
+    de máscaras booleanas: no se copia ni se indexa el DataFrame por el camino.
+    Si el catálogo no es canónico se deja la versión más popular de cada
+    canción, en orden de popularidad descendente.
+
+    Sin ``genre_index`` el género se busca por subcadena; con ``genre_aliases``
+    (ver canonicalize_tracks) también en las versiones descartadas, igual que
+    con el índice.
     """
-
-    df = tracks_df.copy()
-
-    # ===== FILTROS BÁSICOS =====
-    if pop_min is not None and "popularity" in df.columns:
-        df = df[df["popularity"] >= int(pop_min)]
-
-    if year_min or year_max:
-        if "release_date" in df.columns:
-            df["release_year"] = pd.to_datetime(
-                df["release_date"], errors="coerce"
-            ).dt.year
-        elif "album_name" in df.columns:
-            # Extraer año del nombre del álbum si está disponible
-            df["release_year"] = df["album_name"].str.extract(r"(\d{4})").astype(float)
-
-        if year_min and "release_year" in df.columns:
-            df = df[df["release_year"] >= int(year_min)]
-        if year_max and "release_year" in df.columns:
-            df = df[df["release_year"] <= int(year_max)]
-
-    if exclude_ids is not None:
-        df = df[~df["track_id"].isin(exclude_ids)]
-
-    # Mantener solo la más popular de cada canción única
-    if "popularity" in df.columns:
-        df = df.sort_values("popularity", ascending=False)
-    df = df.drop_duplicates(subset=["track_name", "artists"], keep="first")
-
-    if df.empty:
-        return df
-
-    # ===== PREPARACIÓN DE DATOS =====
-    # Escalado robusto de características
-    scaler = StandardScaler()
-    ds_scaled = scaler.fit_transform(df[attr_cols])
-    fav_scaled = scaler.transform(user_favs_df[attr_cols])
-
-    # ===== PERFIL DINÁMICO DEL USUARIO =====
-    base_profile = fav_scaled.mean(axis=0)
-
-    # Ajustar perfil con feedback de likes/dislikes
-    if liked_tracks is not None and not liked_tracks.empty:
-        liked_scaled = scaler.transform(liked_tracks[attr_cols])
-        liked_profile = liked_scaled.mean(axis=0)
-        # Aumentar peso de características de likes
-        base_profile = 0.6 * base_profile + 0.4 * liked_profile
-
-    if disliked_tracks is not None and not disliked_tracks.empty:
-        disliked_scaled = scaler.transform(disliked_tracks[attr_cols])
-        disliked_profile = disliked_scaled.mean(axis=0)
-        # Alejar perfil de características de dislikes
-        base_profile = base_profile + 0.3 * (base_profile - disliked_profile)
-
-    user_profile = base_profile.reshape(1, -1)
-
-    # ===== CLUSTERING PARA MICRO-GÉNEROS =====
-    if use_clustering and len(df) > 100:
-        # K-means para encontrar grupos musicales naturales
-        n_clusters = min(20, len(df) // 100)
-        kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-        df["cluster"] = kmeans.fit_predict(ds_scaled)
-
-        # Encontrar el cluster más similar al perfil del usuario
-        cluster_centers = kmeans.cluster_centers_
-        user_cluster_similarities = cosine_similarity(
-            user_profile, cluster_centers
-        ).flatten()
-        preferred_clusters = np.argsort(user_cluster_similarities)[
-            -3:
-        ]  # Top 3 clusters
-
-        # Filtrar a canciones de clusters preferidos
-        cluster_mask = df["cluster"].isin(preferred_clusters)
-        df_filtered = df[cluster_mask].copy()
-        ds_scaled = ds_scaled[cluster_mask]
+    mask = np.ones(len(tracks_df), dtype=bool)
+
+    if genre and genre_index is not None:
+        _restrict(mask, genre_index.mask(genre), genre_index.index, tracks_df)
+    elif genre and "track_genre" in tracks_df.columns:
+        genre_mask = genre_contains(tracks_df["track_genre"], genre)
+        positions = tracks_df.index.get_indexer(alias_genre_rows(genre_aliases, genre))
+        genre_mask[positions[positions >= 0]] = True
+        mask &= genre_mask
+
+    # Con índices ordenados, cada rango se resuelve por búsqueda binaria
+    if pop_min is not None and popularity_index is not None:
+        bitmap = popularity_index.mask(lo=int(pop_min))
+        _restrict(mask, bitmap, popularity_index.index, tracks_df)
+    elif pop_min is not None and "popularity" in tracks_df.columns:
+        mask &= tracks_df["popularity"].to_numpy() >= int(pop_min)
+
+    if (year_min or year_max) and year_index is not None:
+        bitmap = year_index.mask(
+            lo=int(year_min) if year_min else None,
+            hi=int(year_max) if year_max else None,
+        )
+        _restrict(mask, bitmap, year_index.index, tracks_df)
+    elif year_min or year_max:
+        if "release_year" in tracks_df.columns:
+            release_year = tracks_df["release_year"]
+        else:
+            release_year = derive_release_year(tracks_df)
+        if release_year is not None:
+            years = pd.to_numeric(release_year).to_numpy(dtype=np.float64, na_value=np.nan)
+            if year_min:
+                mask &= years >= int(year_min)
+            if year_max:
+                mask &= years <= int(year_max)
+
+    if exclude_ids is not None and track_id_map is not None:
+        # Cualquier versión excluida descarta su fila canónica
+        excluded_rows = track_id_map.reindex(list(exclude_ids)).dropna()
+        mask &= ~tracks_df.index.isin(excluded_rows.to_numpy(dtype=np.int64))
+    elif exclude_ids is not None:
+        mask &= ~tracks_df["track_id"].isin(exclude_ids).to_numpy(dtype=bool)
+
+    rows = np.flatnonzero(mask)
+
+    # Mantener solo la más popular de cada canción única (el catálogo canónico
+    # ya viene deduplicado desde la carga)
+    if track_id_map is None and len(rows):
+        if "popularity" in tracks_df.columns:
+            popularity = tracks_df["popularity"].to_numpy()[rows]
+            rows = rows[np.argsort(-popularity, kind="stable")]
+        key_cols = tracks_df.columns.get_indexer(["track_name", "artists"])
+        duplicated = tracks_df.iloc[rows, key_cols].duplicated(keep="first")
+        rows = rows[~duplicated.to_numpy()]
+
+    return rows
+
+
+def _profile_vector(
+    user_favs_df, transform, liked_tracks, disliked_tracks, user_profile, dtype
+):
+    """Perfil del usuario (1 x n_attrs) en el espacio escalado"""
+    if user_profile is not None:
+        base_profile = np.ravel(user_profile).astype(dtype)
     else:
-        df_filtered = df.copy()
+        fav_scaled = transform(user_favs_df)
+        base_profile = fav_scaled.mean(axis=0)
 
-    # ===== CÁLCULO DE SIMILITUDES =====
-    sim_scores = parallel_similarity_multicore(
-        ds_scaled, user_profile, n_workers=cpu_count()
-    )
-    df_filtered["similarity"] = sim_scores
+        # Ajustar perfil con feedback de likes/dislikes
+        if liked_tracks is not None and not liked_tracks.empty:
+            liked_scaled = transform(liked_tracks)
+            liked_profile = liked_scaled.mean(axis=0)
+            # Aumentar peso de características de likes
+            base_profile = 0.6 * base_profile + 0.4 * liked_profile
 
-    # ===== ANÁLISIS DE NOVEDAD =====
-    if novelty_boost:
-        # Usar Isolation Forest para encontrar canciones "únicas"
-        iso_forest = IsolationForest(contamination=0.1, random_state=42)
-        novelty_scores = iso_forest.decision_function(ds_scaled)
-        # Convertir a puntuación positiva (más alto = más novedoso)
-        novelty_scores = (novelty_scores - novelty_scores.min()) / (
-            novelty_scores.max() - novelty_scores.min()
-        )
-        df_filtered["novelty"] = novelty_scores
-    else:
-        df_filtered["novelty"] = 0.5
+        if disliked_tracks is not None and not disliked_tracks.empty:
+            disliked_scaled = transform(disliked_tracks)
+            disliked_profile = disliked_scaled.mean(axis=0)
+            # Alejar perfil de características de dislikes
+            base_profile = base_profile + 0.3 * (base_profile - disliked_profile)
+
+    return base_profile.reshape(1, -1)
 
-    # ===== SELECCIÓN INICIAL DE CANDIDATOS =====
-    # Tomar top candidates (más que topn para luego re-rankear)
-    initial_candidates = min(topn * 3, len(df_filtered))
-    top_candidates = df_filtered.nlargest(initial_candidates, "similarity")
 
+def rank_candidates(
+    top_candidates,
+    candidates_scaled,
+    user_library_size,
+    attr_cols,
+    topn,
+    rerank="hybrid",
+    diversity_weight=0.3,
+    max_per_artist=None,
+    max_per_album=None,
+    tracer=NULL_TRACER,
+):
+    """
+    Diversidad, puntuación híbrida y re-ranking final del pool de candidatas
+    (columnas ``similarity`` y ``novelty`` ya calculadas). Lo comparten las
+    peticiones individuales y el lote (backend.batch).
+    """
     # ===== CÁLCULO DE DIVERSIDAD =====
+    span = tracer.start("diversity", rows_in=len(top_candidates))
     diversity_scores = calculate_diversity_score(top_candidates, attr_cols)
     top_candidates["diversity"] = diversity_scores
+    tracer.stop(span, rows_out=len(top_candidates))
 
     # ===== PUNTUACIÓN HÍBRIDA FINAL =====
+    span = tracer.start("hybrid_score", rows_in=len(top_candidates))
     similarity_scores = top_candidates["similarity"].values
     popularity_scores = (
         top_candidates["popularity"].values / 100.0
@@ -231,7 +365,6 @@ def get_advanced_recommendations(
     novelty_scores = top_candidates["novelty"].values
 
     # Pesos adaptativos basados en el tamaño de la biblioteca del usuario
-    user_library_size = len(user_favs_df)
     if user_library_size < 20:
         # Usuario nuevo: priorizar popularidad y similitud
         weights = {
@@ -262,40 +395,428 @@ def get_advanced_recommendations(
     )
 
     top_candidates["hybrid_score"] = hybrid_scores
+    tracer.stop(span, rows_out=len(top_candidates))
 
     # ===== RECOMENDACIONES FINALES =====
-    final_recommendations = top_candidates.nlargest(topn, "hybrid_score")
-
-    # Asegurar diversidad de géneros en el resultado final
-    if (
-        "track_genre" in final_recommendations.columns
-        and len(final_recommendations) > 5
-    ):
-        genre_counts = final_recommendations["track_genre"].value_counts()
-        max_per_genre = max(2, topn // 4)  # Máximo 25% de un género
-
-        diverse_recs = []
-        genre_counter = {}
-
-        for _, row in final_recommendations.iterrows():
-            genre = row["track_genre"]
-            if genre_counter.get(genre, 0) < max_per_genre:
-                diverse_recs.append(row)
-                genre_counter[genre] = genre_counter.get(genre, 0) + 1
-                if len(diverse_recs) >= topn:
-                    break
-
-        final_recommendations = pd.DataFrame(diverse_recs)
+    # Topes por género (máximo 25%), artista y álbum sobre todo el pool de
+    # candidatas, para que siempre se llenen los topn huecos
+    span = tracer.start("rerank", rows_in=len(top_candidates))
+    cap_groups, caps = [], []
+    if "track_genre" in top_candidates.columns and topn > 5:
+        cap_groups.append(top_candidates["track_genre"].to_numpy())
+        caps.append(max(2, topn // 4))
+    if max_per_artist is not None and "artists" in top_candidates.columns:
+        cap_groups.append(top_candidates["artists"].to_numpy())
+        caps.append(max_per_artist)
+    if max_per_album is not None and "album_name" in top_candidates.columns:
+        cap_groups.append(top_candidates["album_name"].to_numpy())
+        caps.append(max_per_album)
+    cap_groups = [pd.factorize(values, use_na_sentinel=False)[0] for values in cap_groups]
+
+    if rerank == "mmr":
+        # MMR sobre el espacio escalado: diversity_weight controla la redundancia
+        order = mmr_rerank(
+            hybrid_scores,
+            candidates_scaled,
+            topn,
+            lambda_=1 - diversity_weight,
+            groups=cap_groups,
+            caps=caps,
+        )
+    else:
+        order = capped_topk(hybrid_scores, topn, groups=cap_groups, caps=caps)
+    final_recommendations = top_candidates.iloc[order]
 
     # Limpiar columnas auxiliares
     cols_to_drop = ["cluster", "similarity", "novelty", "diversity", "hybrid_score"]
     final_recommendations = final_recommendations.drop(
         columns=[col for col in cols_to_drop if col in final_recommendations.columns]
     )
+    tracer.stop(span, rows_out=len(final_recommendations))
 
     return final_recommendations
 
 
+def get_advanced_recommendations(
+    user_favs_df,
+    tracks_df,
+    attr_cols,
+    topn=20,
+    pop_min=None,
+    year_min=None,
+    year_max=None,
+    exclude_ids=None,
+    liked_tracks=None,
+    disliked_tracks=None,
+    use_clustering=True,
+    diversity_weight=0.3,
+    novelty_boost=True,
+    feature_store=None,
+    cluster_index=None,
+    novelty_scores=None,
+    novelty_scope="global",
+    ann_index=None,
+    ann_nprobe=None,
+    ann_exact=False,
+    candidate_pool=None,
+    rerank="hybrid",
+    max_per_artist=None,
+    max_per_album=None,
+    genre=None,
+    genre_index=None,
+    popularity_index=None,
+    year_index=None,
+    track_id_map=None,
+    genre_aliases=None,
+    user_profile=None,
+    tracer=None,
+    stream=False,
+    chunk_size=None,
+    shards=None,
+):
+    """
+    Sistema de recomendación avanzado con múltiples técnicas de ML:
+    - Clustering para encontrar micro-géneros
+    - Análisis de componentes principales (PCA)
+    - Filtrado colaborativo híbrido
+    - Detección de outliers para novedad
+    - Balanceado de diversidad vs similitud
+
+    Si se pasa ``feature_store`` (ver backend.feature_store) se reutiliza la
+    matriz escalada del catálogo en lugar de reajustar el escalado, y con
+    ``cluster_index`` (ver backend.cluster_index) se enruta a los micro-géneros
+    precalculados en lugar de entrenar KMeans en cada petición.
+
+    ``novelty_scope`` elige entre la novedad global precalculada
+    (``novelty_scores``, ver backend.novelty) y la relativa al subconjunto
+    filtrado ("subset"), que se recalcula con IsolationForest en cada petición.
+
+    Con ``ann_index`` (ver backend.ann_index) los candidatos se recuperan del
+    índice IVF; es opcional y aproximado. ``ann_nprobe`` ajusta
+    recall/latencia (por defecto el calibrado al construir el índice) y
+    ``ann_exact=True`` recorre todas las listas para validar contra la
+    búsqueda exacta.
+
+    ``candidate_pool`` fija cuántas candidatas se re-rankean (por defecto
+    ``topn * 3``) y ``rerank="mmr"`` sustituye el corte por puntuación híbrida
+    por Maximal Marginal Relevance. Además del tope por género se pueden fijar
+    ``max_per_artist`` y ``max_per_album``.
+
+    ``genre`` acepta uno o varios géneros separados por comas; con
+    ``genre_index`` (ver backend.catalog_index) se resuelve sin recorrer cadenas.
+    ``popularity_index`` y ``year_index`` resuelven ``pop_min``/``year_min``/
+    ``year_max`` como rangos de filas por búsqueda binaria.
+
+    ``track_id_map`` indica que ``tracks_df`` es el catálogo canónico (ver
+    utils.dataset_loader.canonicalize_tracks): se omite la deduplicación por
+    petición y las exclusiones se resuelven a su fila canónica. Sin
+    ``genre_index``, ``genre_aliases`` hace que el filtro de género también
+    mire las versiones descartadas, como el índice.
+
+    ``user_profile`` es un vector de perfil ya calculado en el espacio del
+    feature store (ver backend.user_profile): evita reescalar ``user_favs_df``,
+    ``liked_tracks`` y ``disliked_tracks`` en cada petición (de las favoritas
+    solo se usa entonces el tamaño de la biblioteca).
+
+    ``tracer`` (ver backend.tracing) registra un span por etapa con tiempo,
+    filas de entrada/salida y pico de memoria; sin él no se mide nada.
+
+    ``tracks_df`` también puede ser un ``Catalog`` (ver backend.catalog): se
+    usa su tabla canónica, su ``track_id_map``, sus ``genre_aliases`` y su
+    matriz float32 contigua.
+
+    Con ``stream=True`` la matriz del feature store no se copia: se recorre su
+    memmap por tramos de ``chunk_size`` filas (ver backend.streaming), filtrando
+    y puntuando cada tramo y guardando solo las mejores candidatas, de modo que
+    la memoria no crece con el catálogo. Devuelve lo mismo que el camino en
+    memoria; requiere catálogo canónico, ``feature_store`` y, si se usan,
+    ``cluster_index`` y ``novelty_scores`` precalculados. Si se pasa
+    ``tracks_df`` la tabla sigue en memoria; con ``tracks_df=None`` se leen
+    por tramos solo las columnas de los filtros de las tablas Parquet del
+    store (ver streaming.save_catalog_tables), y también de ellas
+    ``track_id_map`` y ``genre_aliases`` si no se pasan.
+
+    ``shards`` (un ``ShardedScorer``, ver backend.sharding) reparte esa misma
+    búsqueda entre workers que guardan cada uno un tramo del catálogo: se les
+    difunden perfil y filtros y se funden sus top-k locales, que ya traen las
+    columnas de cada pista. Los índices de clusters y novedad son entonces los
+    que se cargaron en los shards, y de ``tracks_df`` (que puede ser None) y
+    ``feature_store`` solo se usa el escalado.
+    """
+    tracer = tracer or NULL_TRACER
+    catalog = None
+    if isinstance(tracks_df, Catalog):
+        catalog = tracks_df
+        tracks_df = catalog.tracks
+        if track_id_map is None:
+            track_id_map = catalog.track_id_map
+        if genre_aliases is None:
+            genre_aliases = catalog.genre_aliases
+
+    # ===== MODO STREAMING / SHARDS (FUERA DE MEMORIA) =====
+    if stream or shards is not None:
+        has_clusters = cluster_index is not None
+        has_novelty = novelty_scores is not None
+        if shards is not None:
+            has_clusters = shards.centroids is not None
+            has_novelty = shards.has_novelty
+        elif tracks_df is None and feature_store is not None:
+            if not has_catalog_tables(feature_store):
+                raise ValueError("stream sin tracks_df requiere save_catalog_tables")
+            tracks_df = ParquetTracks(feature_store.path)
+        on_disk = shards is not None or isinstance(tracks_df, ParquetTracks)
+        if feature_store is None or (not on_disk and track_id_map is None):
+            raise ValueError("stream requiere el catálogo canónico y su feature_store")
+        if feature_store.attr_cols != list(attr_cols):
+            raise ValueError("attr_cols no coincide con el feature store del catálogo")
+        if shards is None:
+            if _positions_in(feature_store.index, tracks_df) is not None:
+                raise ValueError(
+                    "stream requiere el feature store alineado con tracks_df"
+                )
+        if ann_index is not None:
+            raise ValueError("stream no es compatible con ann_index")
+        if use_clustering and not has_clusters:
+            raise ValueError("stream con clustering requiere cluster_index")
+        if novelty_boost and (not has_novelty or novelty_scope != "global"):
+            raise ValueError("stream con novedad requiere novelty_scores globales")
+        if rerank not in ("hybrid", "mmr"):
+            raise ValueError(f"rerank no soportado: {rerank}")
+
+        span = tracer.start("profile")
+        user_profile = _profile_vector(
+            user_favs_df,
+            feature_store.transform,
+            liked_tracks,
+            disliked_tracks,
+            user_profile,
+            feature_store.features.dtype,
+        )
+        tracer.stop(span)
+
+        filters = dict(
+            pop_min=pop_min,
+            year_min=year_min,
+            year_max=year_max,
+            exclude_ids=exclude_ids,
+            genre=genre,
+        )
+        k = candidate_pool or topn * 3
+        stage = "shard_scoring" if shards is not None else "stream_scoring"
+        span = tracer.start(stage, rows_in=len(feature_store))
+        if shards is not None:
+            top_candidates, sim_scores, candidates_scaled, novelty = (
+                shards.top_candidates(
+                    user_profile,
+                    k,
+                    filters,
+                    use_clustering=use_clustering,
+                    use_genre_index=genre_index is not None,
+                )
+            )
+        else:
+            chunk_filter = ChunkFilter(
+                tracks_df,
+                genre_index=genre_index,
+                track_id_map=track_id_map,
+                genre_aliases=genre_aliases,
+                **filters,
+            )
+            candidate_rows, sim_scores, _ = stream_top_candidates(
+                feature_store,
+                user_profile,
+                k,
+                chunk_filter,
+                cluster_index=cluster_index if use_clustering else None,
+                chunk_size=chunk_size or CHUNK_SIZE,
+            )
+            if isinstance(tracks_df, ParquetTracks):
+                top_candidates = tracks_df.take(candidate_rows)
+            else:
+                top_candidates = tracks_df.iloc[candidate_rows]
+            candidates_scaled = feature_store.take(candidate_rows)
+            if novelty_boost:
+                novelty = np.asarray(novelty_scores[candidate_rows])
+        if len(top_candidates) == 0:
+            tracer.stop(span, rows_out=0)
+            return top_candidates
+
+        top_candidates = top_candidates.copy()
+        top_candidates["similarity"] = sim_scores
+        top_candidates["novelty"] = novelty if novelty_boost else 0.5
+        tracer.stop(span, rows_out=len(top_candidates))
+
+        return rank_candidates(
+            top_candidates,
+            candidates_scaled,
+            len(user_favs_df),
+            attr_cols,
+            topn,
+            rerank=rerank,
+            diversity_weight=diversity_weight,
+            max_per_artist=max_per_artist,
+            max_per_album=max_per_album,
+            tracer=tracer,
+        )
+
+    # ===== FILTROS BÁSICOS =====
+    # Se trabaja con posiciones de fila sobre el catálogo, sin copiarlo
+    span = tracer.start("filters", rows_in=len(tracks_df))
+    rows = filter_catalog_rows(
+        tracks_df,
+        pop_min=pop_min,
+        year_min=year_min,
+        year_max=year_max,
+        exclude_ids=exclude_ids,
+        genre=genre,
+        genre_index=genre_index,
+        popularity_index=popularity_index,
+        year_index=year_index,
+        track_id_map=track_id_map,
+        genre_aliases=genre_aliases,
+    )
+    tracer.stop(span, rows_out=len(rows))
+
+    if len(rows) == 0:
+        return tracks_df.iloc[:0]
+
+    # ===== PREPARACIÓN DE DATOS =====
+    # Escalado robusto de características
+    span = tracer.start("scaling", rows_in=len(rows))
+    if feature_store is not None:
+        if feature_store.attr_cols != list(attr_cols):
+            raise ValueError("attr_cols no coincide con el feature store del catálogo")
+        store_positions = _positions_in(feature_store.index, tracks_df)
+        store_rows = rows if store_positions is None else store_positions[rows]
+        ds_scaled = feature_store.take(store_rows)
+        transform = feature_store.transform
+    else:
+        scaler = StandardScaler()
+        if catalog is not None and catalog.attr_cols == list(attr_cols):
+            # Bloque contiguo de la matriz; el escalado se ajusta en float64
+            # como con el DataFrame para no alterar el orden de resultados
+            values = catalog.take(rows).astype(np.float64)
+        else:
+            values = tracks_df.iloc[rows, tracks_df.columns.get_indexer(attr_cols)]
+        ds_scaled = scaler.fit_transform(values)
+
+        def transform(frame):
+            return scaler.transform(frame[attr_cols])
+
+    tracer.stop(span, rows_out=len(ds_scaled))
+
+    precomputed = (cluster_index, novelty_scores, ann_index)
+    if any(item is not None for item in precomputed) and feature_store is None:
+        raise ValueError("Los índices precalculados requieren el feature_store")
+    if novelty_scope not in ("global", "subset"):
+        raise ValueError(f"novelty_scope no soportado: {novelty_scope}")
+    if rerank not in ("hybrid", "mmr"):
+        raise ValueError(f"rerank no soportado: {rerank}")
+    if user_profile is not None and feature_store is None:
+        raise ValueError("user_profile requiere el feature_store con el que se calculó")
+
+    # ===== PERFIL DINÁMICO DEL USUARIO =====
+    span = tracer.start("profile")
+    user_profile = _profile_vector(
+        user_favs_df,
+        transform,
+        liked_tracks,
+        disliked_tracks,
+        user_profile,
+        ds_scaled.dtype,
+    )
+    tracer.stop(span)
+
+    # ===== CLUSTERING PARA MICRO-GÉNEROS =====
+    span = tracer.start("clustering", rows_in=len(rows))
+    keep = None
+    if use_clustering and len(rows) > 100 and cluster_index is not None:
+        # Índice precalculado: solo similitud usuario-centroide + listas invertidas
+        keep = cluster_index.route(
+            user_profile, store_rows, top=3, min_rows=candidate_pool or topn * 3
+        )
+    elif use_clustering and len(rows) > 100:
+        # K-means para encontrar grupos musicales naturales
+        n_clusters = min(20, len(rows) // 100)
+        kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
+        clusters = kmeans.fit_predict(ds_scaled)
+
+        # Encontrar el cluster más similar al perfil del usuario
+        cluster_centers = kmeans.cluster_centers_
+        user_cluster_similarities = cosine_similarity(
+            user_profile, cluster_centers
+        ).flatten()
+        preferred_clusters = np.argsort(user_cluster_similarities)[
+            -3:
+        ]  # Top 3 clusters
+
+        # Filtrar a canciones de clusters preferidos
+        keep = np.flatnonzero(np.isin(clusters, preferred_clusters))
+
+    if keep is not None:
+        rows = rows[keep]
+        ds_scaled = ds_scaled[keep]
+        if feature_store is not None:
+            store_rows = store_rows[keep]
+    tracer.stop(span, rows_out=len(rows))
+
+    # ===== ANÁLISIS DE NOVEDAD =====
+    span = tracer.start("novelty", rows_in=len(rows))
+    if novelty_boost and novelty_scope == "global" and novelty_scores is not None:
+        # Novedad precalculada sobre todo el catálogo: solo se indexa por fila
+        novelty = np.asarray(novelty_scores[store_rows])
+    elif novelty_boost:
+        # Usar Isolation Forest para encontrar canciones "únicas" del subconjunto
+        novelty = subset_novelty(ds_scaled)
+    else:
+        novelty = np.full(len(rows), 0.5)
+    tracer.stop(span, rows_out=len(novelty))
+
+    # ===== CÁLCULO DE SIMILITUDES Y SELECCIÓN INICIAL DE CANDIDATOS =====
+    # Tomar top candidates (más que topn para luego re-rankear)
+    initial_candidates = min(candidate_pool or topn * 3, len(rows))
+    stage = "ann_search" if ann_index is not None else "similarity"
+    span = tracer.start(stage, rows_in=len(rows))
+    if ann_index is not None:
+        # Recuperación aproximada: solo se puntúan las listas IVF exploradas.
+        # Las filas filtradas ordenadas sirven de filtro y de mapa fila ->
+        # posición, sin arrays del tamaño del catálogo
+        order = np.argsort(store_rows, kind="stable")
+        allowed = store_rows[order]
+        candidate_rows, sim_scores = ann_index.search(
+            user_profile,
+            initial_candidates,
+            nprobe=ann_nprobe,
+            allowed=allowed,
+            exact=ann_exact,
+        )
+        candidate_pos = order[np.searchsorted(allowed, candidate_rows)]
+    else:
+        all_scores = get_scoring_engine().similarity(ds_scaled, user_profile)
+        candidate_pos = np.argsort(-all_scores, kind="stable")[:initial_candidates]
+        sim_scores = all_scores[candidate_pos]
+
+    # Solo se materializan las filas del pool de candidatas
+    top_candidates = tracks_df.iloc[rows[candidate_pos]].copy()
+    top_candidates["similarity"] = sim_scores
+    top_candidates["novelty"] = novelty[candidate_pos]
+    candidates_scaled = ds_scaled[candidate_pos]
+    tracer.stop(span, rows_out=len(top_candidates))
+
+    return rank_candidates(
+        top_candidates,
+        candidates_scaled,
+        len(user_favs_df),
+        attr_cols,
+        topn,
+        rerank=rerank,
+        diversity_weight=diversity_weight,
+        max_per_artist=max_per_artist,
+        max_per_album=max_per_album,
+        tracer=tracer,
+    )
+
+
 # Alias para compatibilidad con código existente
 def get_recommendations(*args, **kwargs):
     return get_advanced_recommendations(*args, **kwargs)
@@ -0,0 +1,181 @@
+import hashlib
+import io
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from backend.db_sqlite import get_pool
+
+MAX_ENTRIES = 512
+MAX_BYTES = 64 * 1024 * 1024
+RESULT_TTL = 15 * 60  # segundos
+
+
+def recommendation_key(
+    user_profile, liked, disliked, filters, topn, version, exclude=()
+):
+    """
+    Huella de una petición: vector de perfil, feedback, filtros, ``topn`` y
+    versión del catálogo. El perfil se redondea para que pequeñas diferencias
+    de coma flotante no generen claves distintas.
+    """
+    digest = hashlib.sha1()
+    profile = np.round(np.ravel(np.asarray(user_profile, dtype=np.float64)), 6)
+    digest.update(profile.tobytes())
+    payload = {
+        "liked": sorted(map(str, liked or ())),
+        "disliked": sorted(map(str, disliked or ())),
+        "exclude": sorted(map(str, exclude or ())),
+        "filters": filters,
+        "topn": topn,
+        "version": version,
+    }
+    digest.update(json.dumps(payload, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Caché de resultados de recomendación compartida por todas las sesiones.
+
+    LRU en memoria acotada por número de entradas y por bytes, con caducidad
+    por entrada. Con ``persist=True`` los resultados también se guardan en la
+    tabla ``recommendation_cache`` de SQLite (Parquet), que sobrevive a los
+    reinicios y se comparte entre procesos.
+    """
+
+    def __init__(
+        self,
+        max_entries=MAX_ENTRIES,
+        max_bytes=MAX_BYTES,
+        ttl=RESULT_TTL,
+        persist=False,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.persist = persist
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+
+    def _drop(self, key):
+        _, nbytes, _ = self._entries.pop(key)
+        self._bytes -= nbytes
+
+    def _put_memory(self, key, result, created):
+        nbytes = int(result.memory_usage(deep=True).sum())
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (created, nbytes, result)
+            self._bytes += nbytes
+            while (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _get_disk(self, key, now):
+        with get_pool().connection() as conn:
+            row = conn.execute(
+                "SELECT payload, created FROM recommendation_cache WHERE key = ?",
+                (key,),
+            ).fetchone()
+        if row is None or now - row[1] > self.ttl:
+            return None
+        result = pd.read_parquet(io.BytesIO(row[0]))
+        self._put_memory(key, result, row[1])
+        return result
+
+    def _put_disk(self, key, result, created):
+        buffer = io.BytesIO()
+        result.to_parquet(buffer)
+        with get_pool().transaction() as conn:
+            conn.execute(
+                "DELETE FROM recommendation_cache WHERE created < ?",
+                (created - self.ttl,),
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO recommendation_cache (key, payload, created) "
+                "VALUES (?, ?, ?)",
+                (key, buffer.getvalue(), created),
+            )
+
+    def get(self, key):
+        """Copia del resultado guardado, o None si no está o caducó"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] > self.ttl:
+                self._drop(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2].copy()
+
+        result = self._get_disk(key, now) if self.persist else None
+        with self._lock:
+            if result is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+        return result.copy()
+
+    def put(self, key, result):
+        created = time.time()
+        result = result.copy()
+        self._put_memory(key, result, created)
+        if self.persist:
+            self._put_disk(key, result, created)
+
+    def get_or_compute(self, key, compute):
+        result = self.get(key)
+        if result is None:
+            result = compute()
+            self.put(key, result)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache(persist=False):
+    """Caché compartida del proceso (el nivel SQLite se activa con ``persist``)"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache(persist=persist)
+        _cache.persist = _cache.persist or persist
+        return _cache
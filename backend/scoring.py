@@ -0,0 +1,86 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Por debajo de este número de filas un único producto matriz-vector es más
+# rápido que repartir el trabajo entre hilos
+PARALLEL_THRESHOLD = 250_000
+
+
+def _cosine_block(matrix, unit_profile, start, stop, out):
+    block = matrix[start:stop]
+    norms = np.sqrt(np.einsum("ij,ij->i", block, block))
+    np.divide(block @ unit_profile, norms, out=out[start:stop], where=norms > 0)
+
+
+class ScoringEngine:
+    """
+    Motor de similitud coseno de larga vida.
+
+    Reutiliza un pool de hilos entre peticiones: el producto matriz-vector de
+    NumPy libera el GIL, así que los hilos comparten la matriz del catálogo sin
+    copiarla ni serializarla (a diferencia de un multiprocessing.Pool).
+    """
+
+    def __init__(self, n_workers=None, parallel_threshold=PARALLEL_THRESHOLD):
+        self.n_workers = n_workers or min(os.cpu_count() or 1, 8)
+        self.parallel_threshold = parallel_threshold
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.n_workers, thread_name_prefix="scoring"
+                )
+            return self._executor
+
+    def similarity(self, matrix, profile):
+        """Similitud coseno de cada fila de ``matrix`` con el vector ``profile``"""
+        matrix = np.asarray(matrix)
+        if not np.issubdtype(matrix.dtype, np.floating):
+            matrix = matrix.astype(np.float64)
+        profile = np.ravel(profile).astype(matrix.dtype)
+        profile_norm = np.linalg.norm(profile)
+        out = np.zeros(matrix.shape[0], dtype=matrix.dtype)
+        if profile_norm == 0 or matrix.shape[0] == 0:
+            return out
+        unit_profile = profile / profile_norm
+
+        n_rows = matrix.shape[0]
+        if self.n_workers == 1 or n_rows < self.parallel_threshold:
+            _cosine_block(matrix, unit_profile, 0, n_rows, out)
+            return out
+
+        chunk_size = int(np.ceil(n_rows / self.n_workers))
+        futures = [
+            self._pool().submit(
+                _cosine_block, matrix, unit_profile, start, start + chunk_size, out
+            )
+            for start in range(0, n_rows, chunk_size)
+        ]
+        for future in futures:
+            future.result()
+        return out
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_scoring_engine():
+    """Motor compartido por todas las peticiones del proceso"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = ScoringEngine()
+        return _engine
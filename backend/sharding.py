@@ -0,0 +1,340 @@
+"""
+Puntuación repartida (scatter-gather) entre procesos o máquinas.
+
+El catálogo se parte en shards de filas contiguas. Cada shard lo sirve un
+worker de larga vida que lee su tramo de características, clusters, novedad y
+tabla canónica del feature store (``save_catalog_tables`` deja la tabla en
+Parquet junto a los arrays). El coordinador (ShardedScorer) solo guarda los
+límites de cada tramo y los centroides: difunde el perfil y los filtros, cada
+shard devuelve su top-k local por micro-género con las columnas de cada pista
+y el coordinador los funde con la misma regla que el camino en memoria.
+
+El transporte es multiprocessing.connection: tuberías para workers locales
+(``ShardedScorer.spawn``) o sockets TCP/Unix con clave para workers en otros
+nodos (``python -m backend.sharding --listen host:puerto`` y
+``ShardedScorer.connect``), que leen el store de un disco compartido o de una
+copia local (``--store-dir``).
+"""
+
+import argparse
+import multiprocessing
+import os
+import threading
+import traceback
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+import pandas as pd
+
+from backend.catalog_index import GenreIndex
+from backend.cluster_index import rank_clusters
+from backend.streaming import (
+    CHUNK_SIZE,
+    ChunkFilter,
+    has_catalog_tables,
+    read_catalog_rows,
+    scan_top_candidates,
+)
+
+AUTHKEY_ENV = "SHARD_AUTHKEY"
+
+
+# ===== WORKER =====
+class Shard:
+    """Tramo ``[start, stop)`` del catálogo con todo lo necesario para puntuarlo"""
+
+    def __init__(
+        self,
+        start,
+        features,
+        tracks,
+        track_id_map,
+        labels=None,
+        n_clusters=0,
+        novelty=None,
+        genre_aliases=None,
+    ):
+        self.start = start
+        self.features = features
+        self.tracks = tracks
+        self.track_id_map = track_id_map
+        self.labels = labels
+        self.n_clusters = n_clusters
+        self.novelty = novelty
+        self.genre_aliases = genre_aliases
+        self.genre_index = None
+        if "track_genre" in tracks.columns:
+            self.genre_index = GenreIndex.from_frame(tracks, aliases=genre_aliases)
+
+    @classmethod
+    def open(cls, path, start, stop, clusters=True, novelty=True):
+        """Lee del feature store en ``path`` el tramo ``[start, stop)``"""
+        features = np.load(os.path.join(path, "features.npy"), mmap_mode="r")
+        tracks = read_catalog_rows(path, "tracks", start, stop)
+        ids = read_catalog_rows(path, "track_id_map", start, stop)
+        kwargs = {
+            "features": np.array(features[start:stop]),
+            "tracks": tracks.drop(columns="row"),
+            "track_id_map": pd.Series(ids["row"].to_numpy(), index=ids["track_id"]),
+            "genre_aliases": read_catalog_rows(path, "genre_aliases", start, stop),
+        }
+        if clusters:
+            labels = np.load(os.path.join(path, "cluster_labels.npy"), mmap_mode="r")
+            centroids = np.load(os.path.join(path, "cluster_centroids.npy"))
+            kwargs["labels"] = np.array(labels[start:stop])
+            kwargs["n_clusters"] = centroids.shape[0]
+        if novelty:
+            scores = np.load(os.path.join(path, "novelty.npy"), mmap_mode="r")
+            kwargs["novelty"] = np.array(scores[start:stop])
+        return cls(start, **kwargs)
+
+    def score(
+        self,
+        user_profile,
+        k,
+        filters,
+        use_clustering=True,
+        use_genre_index=True,
+        chunk_size=CHUNK_SIZE,
+    ):
+        """
+        Top-k local por cluster: las filas (con el índice global del catálogo),
+        sus puntuaciones, características y novedad. Sin ``use_genre_index`` el
+        género se busca por subcadena (con los alias).
+        """
+        chunk_filter = ChunkFilter(
+            self.tracks,
+            genre_index=self.genre_index if use_genre_index else None,
+            track_id_map=self.track_id_map,
+            genre_aliases=self.genre_aliases,
+            **filters,
+        )
+        labels = self.labels if use_clustering else None
+        top, counts, n_filtered = scan_top_candidates(
+            self.features,
+            user_profile,
+            k,
+            chunk_filter,
+            labels=labels,
+            n_clusters=self.n_clusters,
+            chunk_size=chunk_size,
+        )
+        groups = [np.empty(0, dtype=np.int64)]
+        scores = [np.empty(0, dtype=np.float32)]
+        rows = [np.empty(0, dtype=np.int64)]
+        for group, group_scores, group_rows in top.items():
+            groups.append(np.full(len(group_rows), group, dtype=np.int64))
+            scores.append(group_scores)
+            rows.append(group_rows)
+        rows = np.concatenate(rows)
+        candidates = self.tracks.iloc[rows]
+        return {
+            "n_filtered": n_filtered,
+            "counts": counts,
+            "groups": np.concatenate(groups),
+            "scores": np.concatenate(scores),
+            "candidates": candidates.set_axis(rows + self.start),
+            "features": np.asarray(self.features[rows]),
+            "novelty": None if self.novelty is None else self.novelty[rows],
+        }
+
+
+def _serve(conn, store_dir=None):
+    """
+    Atiende mensajes de un coordinador hasta que cierra la conexión. Con
+    ``store_dir`` el store se busca ahí (misma versión) en lugar de en la ruta
+    del coordinador.
+    """
+    shard = None
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        command, payload = message
+        if command == "close":
+            break
+        try:
+            if command == "load":
+                if store_dir:
+                    version = os.path.basename(os.path.normpath(payload["path"]))
+                    payload["path"] = os.path.join(store_dir, version)
+                shard = Shard.open(**payload)
+                conn.send(("ok", len(shard.features)))
+            elif command == "score":
+                conn.send(("ok", shard.score(**payload)))
+            else:
+                raise ValueError(f"Comando de shard no soportado: {command}")
+        except Exception:
+            conn.send(("error", traceback.format_exc()))
+    conn.close()
+
+
+def serve(address, authkey, store_dir=None):
+    """Worker de shard en otro nodo: atiende coordinadores uno tras otro"""
+    with Listener(address, authkey=authkey) as listener:
+        while True:
+            with listener.accept() as conn:
+                _serve(conn, store_dir)
+
+
+# ===== COORDINADOR =====
+class ShardedScorer:
+    """
+    Coordinador de shards: difunde cada petición, recoge los top-k locales y
+    los funde. Las peticiones se serializan con un lock (cada conexión es un
+    canal petición-respuesta), pero los shards puntúan en paralelo.
+    """
+
+    def __init__(self, connections, processes=()):
+        self.connections = list(connections)
+        self.centroids = None
+        self.has_novelty = False
+        self._processes = list(processes)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def spawn(cls, n_shards, feature_store, **load_kwargs):
+        """Lanza ``n_shards`` workers locales (spawn) y les reparte el catálogo"""
+        ctx = multiprocessing.get_context("spawn")
+        connections, processes = [], []
+        for _ in range(n_shards):
+            parent, child = ctx.Pipe()
+            process = ctx.Process(target=_serve, args=(child,), daemon=True)
+            process.start()
+            child.close()
+            connections.append(parent)
+            processes.append(process)
+        scorer = cls(connections, processes=processes)
+        scorer.load(feature_store, **load_kwargs)
+        return scorer
+
+    @classmethod
+    def connect(cls, addresses, feature_store, authkey=None, **load_kwargs):
+        """Se conecta a workers remotos (ver ``serve``) y les reparte el catálogo"""
+        authkey = authkey or os.environ.get(AUTHKEY_ENV, "").encode()
+        connections = [Client(address, authkey=authkey) for address in addresses]
+        scorer = cls(connections)
+        scorer.load(feature_store, **load_kwargs)
+        return scorer
+
+    def __len__(self):
+        return len(self.connections)
+
+    def _scatter_gather(self, messages):
+        with self._lock:
+            for conn, message in zip(self.connections, messages):
+                conn.send(message)
+            replies = [conn.recv() for conn in self.connections]
+        errors = [payload for status, payload in replies if status == "error"]
+        if errors:
+            raise RuntimeError(f"Fallo en un shard:\n{errors[0]}")
+        return [payload for _, payload in replies]
+
+    def load(self, feature_store, clusters=True, novelty=True):
+        """
+        Parte el catálogo canónico en tramos contiguos, uno por shard; cada
+        shard los lee del store (ver save_catalog_tables). ``clusters`` y
+        ``novelty`` se cargan si el store tiene sus arrays.
+        """
+        if not has_catalog_tables(feature_store):
+            raise ValueError("Guarda antes el catálogo con save_catalog_tables")
+        clusters = clusters and feature_store.has_array("cluster_labels")
+        novelty = novelty and feature_store.has_array("novelty")
+        bounds = np.linspace(0, len(feature_store), len(self) + 1).astype(np.int64)
+        self._scatter_gather(
+            [
+                (
+                    "load",
+                    {
+                        "path": feature_store.path,
+                        "start": int(start),
+                        "stop": int(stop),
+                        "clusters": clusters,
+                        "novelty": novelty,
+                    },
+                )
+                for start, stop in zip(bounds[:-1], bounds[1:])
+            ]
+        )
+        self.centroids = None
+        if clusters:
+            self.centroids = feature_store.load_array("cluster_centroids", mmap=False)
+        self.has_novelty = novelty
+
+    def top_candidates(
+        self, user_profile, k, filters, use_clustering=True, use_genre_index=True
+    ):
+        """
+        Fusión de los top-k de todos los shards.
+
+        Devuelve ``(candidates, scores, features, novelty)`` de las ``k``
+        mejores filas: ``candidates`` son sus columnas del catálogo, indexadas
+        por fila canónica (``novelty`` es None si los shards no la tienen).
+        """
+        use_clustering = use_clustering and self.centroids is not None
+        request = {
+            "user_profile": np.asarray(user_profile),
+            "k": k,
+            "filters": filters,
+            "use_clustering": use_clustering,
+            "use_genre_index": use_genre_index,
+        }
+        replies = self._scatter_gather([("score", request)] * len(self))
+
+        n_filtered = sum(reply["n_filtered"] for reply in replies)
+        groups = np.concatenate([reply["groups"] for reply in replies])
+        scores = np.concatenate([reply["scores"] for reply in replies])
+        candidates = pd.concat([reply["candidates"] for reply in replies])
+        features = np.concatenate([reply["features"] for reply in replies])
+        rows = candidates.index.to_numpy()
+
+        keep = np.arange(len(rows))
+        if use_clustering and n_filtered > 100:
+            counts = np.sum([reply["counts"] for reply in replies], axis=0)
+            preferred = rank_clusters(
+                self.centroids, user_profile, counts, top=3, min_rows=k
+            )
+            keep = np.flatnonzero(np.isin(groups, preferred))
+        keep = keep[np.lexsort((rows[keep], -scores[keep]))[:k]]
+
+        novelty = None
+        if self.has_novelty:
+            novelty = np.concatenate([reply["novelty"] for reply in replies])[keep]
+        return candidates.iloc[keep], scores[keep], features[keep], novelty
+
+    def close(self):
+        with self._lock:
+            for conn in self.connections:
+                try:
+                    conn.send(("close", None))
+                    conn.close()
+                except OSError:
+                    pass
+            self.connections = []
+        for process in self._processes:
+            process.join(timeout=5)
+        self._processes = []
+
+
+def _parse_address(value):
+    host, _, port = value.rpartition(":")
+    return (host or "127.0.0.1", int(port))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Worker de shard del recomendador")
+    parser.add_argument("--listen", required=True, help="host:puerto donde escuchar")
+    parser.add_argument(
+        "--store-dir",
+        help="copia local del store de catálogos (por defecto, la del coordinador)",
+    )
+    args = parser.parse_args(argv)
+    authkey = os.environ.get(AUTHKEY_ENV)
+    if not authkey:
+        parser.error(f"Define {AUTHKEY_ENV} con la clave compartida del clúster")
+    serve(_parse_address(args.listen), authkey.encode(), args.store_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -18,9 +18,11 @@ def get_spotify_client():
     return sp
 
 
-def get_user_liked_tracks(sp, limit=200):
+def get_user_liked_tracks(sp, limit=50):
+    # La API no admite más de 50 canciones por página; para sincronizar la
+    # biblioteca de forma incremental ver backend.library_sync
     tracks = []
-    results = sp.current_user_saved_tracks(limit=limit)
+    results = sp.current_user_saved_tracks(limit=min(limit, 50))
     while results:
         for item in results["items"]:
             track = item["track"]
@@ -0,0 +1,388 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from backend.catalog_index import alias_genre_rows, derive_release_year, genre_contains
+from backend.scoring import get_scoring_engine
+
+# Filas del memmap que se filtran y puntúan de una vez
+CHUNK_SIZE = 65_536
+# Tablas del catálogo en Parquet; todas llevan la fila canónica en "row"
+CATALOG_TABLES = ["tracks", "track_id_map", "genre_aliases"]
+
+
+# ===== CATÁLOGO EN PARQUET =====
+def _table_path(path, name):
+    return os.path.join(path, f"{name}.parquet")
+
+
+def has_catalog_tables(feature_store):
+    return os.path.exists(_table_path(feature_store.path, "tracks"))
+
+
+def save_catalog_tables(feature_store, tracks_df, track_id_map, genre_aliases=None):
+    """
+    Guarda junto al feature store la tabla canónica, ``track_id_map`` y los
+    alias de género, en grupos de ``CHUNK_SIZE`` filas, para leerlos por
+    tramos (ParquetTracks, shards). Se escribe una vez por versión del catálogo.
+    """
+    if has_catalog_tables(feature_store):
+        return
+    tables = {
+        "tracks": tracks_df.reset_index(drop=True).assign(
+            row=np.arange(len(tracks_df))
+        ),
+        "track_id_map": pd.DataFrame(
+            {"track_id": track_id_map.index, "row": track_id_map.to_numpy()}
+        ),
+        "genre_aliases": genre_aliases,
+    }
+    # tracks va la última: su presencia marca el catálogo como completo
+    for name in reversed(CATALOG_TABLES):
+        if tables[name] is None:
+            continue
+        path = _table_path(feature_store.path, name)
+        tables[name].to_parquet(
+            f"{path}.tmp", index=False, row_group_size=CHUNK_SIZE
+        )
+        os.replace(f"{path}.tmp", path)
+
+
+def read_catalog_rows(path, name, start, stop):
+    """Filas de una tabla del catálogo con ``row`` en ``[start, stop)``"""
+    path = _table_path(path, name)
+    if not os.path.exists(path):
+        return None
+    table = pd.read_parquet(path, filters=[("row", ">=", start), ("row", "<", stop)])
+    return table.assign(row=table["row"] - start)
+
+
+class ParquetTracks:
+    """
+    Tabla canónica guardada junto al feature store (ver save_catalog_tables)
+    leída por grupos de filas. Sustituye a ``tracks_df`` en el modo streaming:
+    ninguna columna del catálogo se carga entera.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.metadata = pq.read_metadata(_table_path(path, "tracks"))
+        sizes = [
+            self.metadata.row_group(group).num_rows
+            for group in range(self.metadata.num_row_groups)
+        ]
+        self.offsets = np.concatenate([[0], np.cumsum(sizes, dtype=np.int64)])
+        self.columns = pd.Index(
+            [name for name in self.metadata.schema.names if name != "row"]
+        )
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    @property
+    def index(self):
+        return pd.RangeIndex(len(self))
+
+    def _reader(self):
+        # Un lector por llamada: ParquetFile no se comparte entre hilos
+        return pq.ParquetFile(_table_path(self.path, "tracks"), metadata=self.metadata)
+
+    def read(self, start, stop, columns=None):
+        """Filas ``[start, stop)`` (solo ``columns``), indexadas por fila"""
+        first = np.searchsorted(self.offsets, start, side="right") - 1
+        last = np.searchsorted(self.offsets, stop, side="left")
+        table = self._reader().read_row_groups(range(first, last), columns=columns)
+        table = table.slice(start - self.offsets[first], stop - start)
+        frame = table.to_pandas().drop(columns="row", errors="ignore")
+        return frame.set_axis(pd.RangeIndex(start, stop))
+
+    def take(self, rows):
+        """
+        Filas ``rows`` (en ese orden) con todas sus columnas. Se decodifica un
+        grupo de filas cada vez y solo las pedidas pasan a pandas.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) == 0:
+            return self.read(0, min(len(self), 1)).iloc[:0]
+        reader = self._reader()
+        order = np.argsort(rows, kind="stable")
+        row_groups = np.searchsorted(self.offsets, rows[order], side="right") - 1
+        parts = []
+        for group in np.unique(row_groups):
+            in_group = rows[order][row_groups == group] - self.offsets[group]
+            parts.append(reader.read_row_group(int(group)).take(in_group))
+        table = pa.concat_tables(parts)
+        # Las categorías arrastran el diccionario de todo el catálogo: se
+        # decodifican y se vuelven a codificar solo con los valores tomados
+        dictionaries = [
+            field.name for field in table.schema if pa.types.is_dictionary(field.type)
+        ]
+        for name in dictionaries:
+            index = table.schema.get_field_index(name)
+            column = table.column(index)
+            table = table.set_column(
+                index, name, column.cast(column.type.value_type)
+            )
+        frame = table.to_pandas().drop(columns="row")
+        frame = frame.astype({name: "category" for name in dictionaries})
+        # Volver al orden pedido
+        frame = frame.iloc[np.argsort(order, kind="stable")]
+        return frame.set_axis(rows)
+
+    def resolve_ids(self, track_ids):
+        """Filas canónicas (ordenadas) de ``track_ids``, como track_id_map"""
+        wanted = pa.array(list(track_ids), type=pa.string())
+        parquet = pq.ParquetFile(_table_path(self.path, "track_id_map"))
+        parts = [np.empty(0, dtype=np.int64)]
+        for batch in parquet.iter_batches(batch_size=CHUNK_SIZE):
+            hits = pc.is_in(batch.column("track_id"), value_set=wanted)
+            parts.append(batch.filter(hits).column("row").to_numpy())
+        return np.unique(np.concatenate(parts).astype(np.int64))
+
+    def alias_rows(self, query):
+        """alias_genre_rows sobre genre_aliases.parquet, por lotes"""
+        path = _table_path(self.path, "genre_aliases")
+        if not os.path.exists(path):
+            return np.empty(0, dtype=np.int64)
+        parts = [np.empty(0, dtype=np.int64)]
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=CHUNK_SIZE):
+            parts.append(alias_genre_rows(batch.to_pandas(), query))
+        return np.unique(np.concatenate(parts))
+
+
+# ===== FILTROS Y TOP-K POR TRAMOS =====
+
+class ChunkFilter:
+    """
+    Filtros de una petición evaluados por tramos de filas del catálogo canónico.
+
+    Equivale a filter_catalog_rows sin construir ningún bitmap del tamaño del
+    catálogo. Con un DataFrame la tabla sigue entera en memoria y solo se
+    recorre por tramos; con una ParquetTracks cada tramo lee del disco solo
+    las columnas que usan los filtros, y ``track_id_map`` y ``genre_aliases``
+    se resuelven desde sus tablas. Sin ``genre_index`` el género se busca por
+    subcadena, también en las versiones descartadas de ``genre_aliases``.
+    """
+
+    def __init__(
+        self,
+        tracks_df,
+        pop_min=None,
+        year_min=None,
+        year_max=None,
+        exclude_ids=None,
+        genre=None,
+        genre_index=None,
+        track_id_map=None,
+        genre_aliases=None,
+    ):
+        self.tracks_df = tracks_df
+        self.pop_min = int(pop_min) if pop_min is not None else None
+        self.year_min = int(year_min) if year_min else None
+        self.year_max = int(year_max) if year_max else None
+        self.genre = genre
+        self.genre_index = genre_index
+        self.genre_categories = None
+        self.genre_alias_rows = None
+        on_disk = isinstance(tracks_df, ParquetTracks)
+        if genre and genre_index is not None:
+            self.genre_categories = genre_index.matching_categories(genre)
+        elif genre and on_disk and genre_aliases is None:
+            self.genre_alias_rows = tracks_df.alias_rows(genre)
+        elif genre:
+            self.genre_alias_rows = alias_genre_rows(genre_aliases, genre)
+
+        # Filas canónicas excluidas, ordenadas para recortarlas por tramo
+        self.excluded = np.empty(0, dtype=np.int64)
+        if exclude_ids is not None and on_disk and track_id_map is None:
+            self.excluded = tracks_df.resolve_ids(exclude_ids)
+        elif exclude_ids is not None:
+            excluded = track_id_map.reindex(list(exclude_ids)).dropna()
+            self.excluded = np.unique(excluded.to_numpy(dtype=np.int64))
+
+        # Columnas que leen los filtros en cada tramo
+        columns = []
+        if genre and self.genre_categories is None:
+            columns.append("track_genre")
+        if self.pop_min is not None:
+            columns.append("popularity")
+        if self.year_min is not None or self.year_max is not None:
+            for col in ("release_year", "release_date", "album_name"):
+                if col in tracks_df.columns:
+                    columns.append(col)
+                    break
+        self.columns = [col for col in columns if col in tracks_df.columns]
+
+    def _chunk(self, start, stop):
+        if not isinstance(self.tracks_df, ParquetTracks):
+            return self.tracks_df.iloc[start:stop]
+        if not self.columns:
+            return pd.DataFrame(index=pd.RangeIndex(start, stop))
+        return self.tracks_df.read(start, stop, self.columns)
+
+    def mask(self, start, stop):
+        chunk = self._chunk(start, stop)
+        mask = np.ones(stop - start, dtype=bool)
+
+        if self.genre_categories is not None:
+            mask &= self.genre_index.chunk_mask(self.genre_categories, start, stop)
+        elif self.genre and "track_genre" in chunk.columns:
+            genre_mask = genre_contains(chunk["track_genre"], self.genre)
+            lo, hi = np.searchsorted(self.genre_alias_rows, [start, stop])
+            genre_mask[self.genre_alias_rows[lo:hi] - start] = True
+            mask &= genre_mask
+
+        if self.pop_min is not None and "popularity" in chunk.columns:
+            mask &= chunk["popularity"].to_numpy() >= self.pop_min
+
+        if self.year_min is not None or self.year_max is not None:
+            if "release_year" in chunk.columns:
+                release_year = chunk["release_year"]
+            else:
+                release_year = derive_release_year(chunk)
+            if release_year is not None:
+                years = pd.to_numeric(release_year).to_numpy(
+                    dtype=np.float64, na_value=np.nan
+                )
+                if self.year_min is not None:
+                    mask &= years >= self.year_min
+                if self.year_max is not None:
+                    mask &= years <= self.year_max
+
+        lo, hi = np.searchsorted(self.excluded, [start, stop])
+        mask[self.excluded[lo:hi] - start] = False
+        return mask
+
+
+class TopK:
+    """
+    Las ``k`` mejores puntuaciones vistas hasta ahora, separadas por grupo.
+
+    Cada tramo se funde con lo acumulado y se recorta a ``k`` filas por grupo,
+    así que la memoria es O(k · grupos) sea cual sea el tamaño del catálogo.
+    Los empates se resuelven por fila ascendente, como el argsort estable del
+    camino en memoria.
+    """
+
+    def __init__(self, k):
+        self.k = k
+        self._buckets = {}
+
+    def _merge(self, group, scores, rows):
+        if group in self._buckets:
+            old_scores, old_rows = self._buckets[group]
+            scores = np.concatenate([old_scores, scores])
+            rows = np.concatenate([old_rows, rows])
+        order = np.lexsort((rows, -scores))[: self.k]
+        self._buckets[group] = (scores[order], rows[order])
+
+    def push(self, scores, rows, groups=None):
+        if len(rows) == 0:
+            return
+        if groups is None:
+            groups = np.zeros(len(rows), dtype=np.int64)
+        order = np.lexsort((rows, -scores, groups))
+        sorted_groups = groups[order]
+        bounds = np.flatnonzero(np.diff(sorted_groups)) + 1
+        for start, stop in zip(np.r_[0, bounds], np.r_[bounds, len(order)]):
+            take = order[start : min(stop, start + self.k)]
+            self._merge(int(sorted_groups[start]), scores[take], rows[take])
+
+    def items(self):
+        """``(group, scores, rows)`` de cada grupo, para fundirlos en otro sitio"""
+        for group, (scores, rows) in self._buckets.items():
+            yield group, scores, rows
+
+    def result(self, groups=None):
+        """``(rows, scores)`` de las ``k`` mejores entre ``groups`` (todos si None)"""
+        keys = self._buckets if groups is None else groups
+        parts = [self._buckets[int(key)] for key in keys if int(key) in self._buckets]
+        if not parts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        scores = np.concatenate([part[0] for part in parts])
+        rows = np.concatenate([part[1] for part in parts])
+        order = np.lexsort((rows, -scores))[: self.k]
+        return rows[order], scores[order]
+
+
+def scan_top_candidates(
+    features,
+    user_profile,
+    k,
+    chunk_filter,
+    labels=None,
+    n_clusters=0,
+    chunk_size=CHUNK_SIZE,
+    engine=None,
+):
+    """
+    Recorre ``features`` (array o memmap) por tramos de ``chunk_size`` filas:
+    filtra cada tramo, puntúa sus filas contra el perfil y conserva solo las
+    ``k`` mejores por cluster (``labels``), con memoria O(tramo + k).
+
+    Devuelve ``(top, counts, n_filtered)``: el TopK por cluster, cuántas filas
+    filtradas tiene cada cluster (None sin ``labels``) y cuántas filas pasaron
+    los filtros.
+    """
+    engine = engine or get_scoring_engine()
+    top = TopK(k)
+    counts = np.zeros(n_clusters, dtype=np.int64) if labels is not None else None
+    n_filtered = 0
+
+    for start in range(0, len(features), chunk_size):
+        stop = min(start + chunk_size, len(features))
+        rows = start + np.flatnonzero(chunk_filter.mask(start, stop))
+        if len(rows) == 0:
+            continue
+        # Solo se leen del disco las filas que pasan los filtros
+        scores = engine.similarity(features[rows], user_profile)
+        groups = None
+        if labels is not None:
+            groups = np.asarray(labels[rows], dtype=np.int64)
+            counts += np.bincount(groups, minlength=n_clusters)
+        top.push(scores, rows, groups)
+        n_filtered += len(rows)
+    return top, counts, n_filtered
+
+
+def stream_top_candidates(
+    feature_store,
+    user_profile,
+    k,
+    chunk_filter,
+    cluster_index=None,
+    chunk_size=CHUNK_SIZE,
+    engine=None,
+):
+    """
+    Candidatas del memmap del feature store recorrido por tramos (ver
+    scan_top_candidates).
+
+    Con ``cluster_index`` se replica el enrutado del camino en memoria: al
+    terminar se eligen los clusters preferidos entre los que tienen filas
+    filtradas (si hay más de 100; al menos 3 y los necesarios para reunir
+    ``k`` filas) y se funden solo sus candidatas.
+
+    Devuelve ``(rows, scores, n_filtered)``.
+    """
+    top, counts, n_filtered = scan_top_candidates(
+        feature_store.features,
+        user_profile,
+        k,
+        chunk_filter,
+        labels=cluster_index.labels if cluster_index is not None else None,
+        n_clusters=cluster_index.n_clusters if cluster_index is not None else 0,
+        chunk_size=chunk_size,
+        engine=engine,
+    )
+    groups = None
+    if cluster_index is not None and n_filtered > 100:
+        groups = cluster_index.preferred_clusters(
+            user_profile, top=3, counts=counts, min_rows=k
+        )
+    rows, scores = top.result(groups)
+    return rows, scores, n_filtered
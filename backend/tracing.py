@@ -0,0 +1,218 @@
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+
+TRACE_PATH_ENV = "RECOMMENDER_TRACE_PATH"
+
+# tracemalloc es global al proceso: se arranca con el primer span que mide
+# memoria y se para con el último (si no lo había arrancado otro código)
+_tracemalloc_users = 0
+_tracemalloc_owned = False
+_tracemalloc_lock = threading.Lock()
+
+
+def _acquire_tracemalloc():
+    """Registra un span que mide memoria; devuelve la memoria trazada actual"""
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _tracemalloc_owned = True
+            # Solo se reinicia el pico si no hay otro span midiendo
+            tracemalloc.reset_peak()
+        _tracemalloc_users += 1
+        return tracemalloc.get_traced_memory()[0]
+
+
+def _release_tracemalloc():
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0 and _tracemalloc_owned:
+            tracemalloc.stop()
+            _tracemalloc_owned = False
+
+
+class Span:
+    """Una etapa del pipeline: tiempo, filas de entrada/salida y pico de memoria"""
+
+    __slots__ = (
+        "name",
+        "seconds",
+        "rows_in",
+        "rows_out",
+        "peak_bytes",
+        "_start",
+        "_base",
+    )
+
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.seconds = None
+        self.peak_bytes = None
+
+    def as_dict(self):
+        return {
+            "stage": self.name,
+            "seconds": self.seconds,
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "peak_bytes": self.peak_bytes,
+        }
+
+
+class Tracer:
+    """
+    Registra un span por etapa de una petición.
+
+    Uso: ``span = tracer.start("etapa", rows_in=n)`` ... ``tracer.stop(span,
+    rows_out=m)``; al terminar, ``tracer.finish()`` devuelve la traza como
+    diccionario y la envía a los sinks (JSONL, logging...). Con
+    ``memory=True`` se mide el pico de memoria de cada etapa con tracemalloc,
+    que ralentiza la ejecución: pensado para depurar, no para producción.
+
+    tracemalloc mide todo el proceso: con varias peticiones trazadas a la vez
+    (sesiones concurrentes) el pico de un span incluye las asignaciones de
+    las demás y es solo una cota superior. Cada span abierto mantiene
+    tracemalloc activo; ``close()`` (o ``finish()``) libera los que una
+    excepción haya dejado abiertos.
+    """
+
+    enabled = True
+
+    def __init__(self, memory=False, sinks=()):
+        self.memory = memory
+        self.sinks = list(sinks)
+        self.spans = []
+        self.trace_id = uuid.uuid4().hex[:12]
+        self._open = set()
+
+    def start(self, name, rows_in=None):
+        span = Span(name, rows_in)
+        if self.memory:
+            span._base = _acquire_tracemalloc()
+            self._open.add(span)
+        span._start = time.perf_counter()
+        return span
+
+    def stop(self, span, rows_out=None):
+        span.seconds = time.perf_counter() - span._start
+        span.rows_out = rows_out
+        if span in self._open:
+            span.peak_bytes = max(0, tracemalloc.get_traced_memory()[1] - span._base)
+            self._open.discard(span)
+            _release_tracemalloc()
+        self.spans.append(span)
+        return span
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        span = self.start(name, rows_in)
+        try:
+            yield span
+        finally:
+            self.stop(span, span.rows_out)
+
+    def records(self):
+        return [span.as_dict() for span in self.spans]
+
+    def close(self):
+        """Libera tracemalloc de los spans que quedaron sin cerrar"""
+        while self._open:
+            self._open.pop()
+            _release_tracemalloc()
+
+    def finish(self, **meta):
+        """Cierra la traza, la envía a los sinks y la devuelve"""
+        self.close()
+        trace = {
+            "trace_id": self.trace_id,
+            "ts": time.time(),
+            "total_seconds": sum(span.seconds for span in self.spans),
+            **meta,
+            "spans": self.records(),
+        }
+        for sink in self.sinks:
+            sink.write(trace)
+        return trace
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class NullTracer:
+    """Trazador sin efecto: coste de una llamada a método por etapa"""
+
+    enabled = False
+    spans = ()
+
+    def start(self, name, rows_in=None):
+        return _NULL_SPAN
+
+    def stop(self, span, rows_out=None):
+        return span
+
+    def stage(self, name, rows_in=None):
+        return _NULL_SPAN
+
+    def records(self):
+        return []
+
+    def close(self):
+        pass
+
+    def finish(self, **meta):
+        return None
+
+
+NULL_TRACER = NullTracer()
+
+
+# ===== SINKS =====
+class JsonlSink:
+    """Añade cada traza como una línea JSON (para agregarlas después)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def write(self, trace):
+        line = json.dumps(trace, default=str)
+        with self._lock, open(self.path, "a") as fh:
+            fh.write(line + "\n")
+
+
+class LoggingSink:
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger or logging.getLogger("recommender.trace")
+        self.level = level
+
+    def write(self, trace):
+        self.logger.log(self.level, json.dumps(trace, default=str))
+
+
+def default_sinks():
+    """Sink JSONL si se define RECOMMENDER_TRACE_PATH en el entorno"""
+    path = os.environ.get(TRACE_PATH_ENV)
+    return [JsonlSink(path)] if path else []
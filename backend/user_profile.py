@@ -0,0 +1,135 @@
+import numpy as np
+
+from backend.db_sqlite import DISLIKE, LIKE, get_pool, _insert_feedback, _invalidate
+
+KINDS = ("base", "liked", "disliked")
+_KIND_BY_POLARITY = {LIKE: "liked", DISLIKE: "disliked"}
+
+
+class ProfileVectors:
+    """
+    Perfil del usuario en el espacio escalado del feature store, guardado como
+    sumas y recuentos por tipo (favoritas, likes, dislikes).
+
+    Cada 👍/👎 suma o resta una fila de características: O(d) por evento. El
+    vector de perfil se deriva de las medias con los mismos pesos que el
+    recomendador. Las sumas solo valen para la versión del catálogo
+    (``version``) con cuyo escalado se calcularon.
+    """
+
+    def __init__(self, version, sums, counts):
+        self.version = version
+        self.sums = sums
+        self.counts = counts
+
+    @classmethod
+    def empty(cls, version, dim):
+        return cls(
+            version,
+            {kind: np.zeros(dim, dtype=np.float64) for kind in KINDS},
+            {kind: 0 for kind in KINDS},
+        )
+
+    def add(self, kind, vectors, sign=1):
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float64))
+        self.sums[kind] += sign * vectors.sum(axis=0)
+        self.counts[kind] += sign * len(vectors)
+        if self.counts[kind] <= 0:
+            # Evita arrastrar error de redondeo cuando el grupo queda vacío
+            self.sums[kind][:] = 0
+            self.counts[kind] = 0
+
+    def mean(self, kind):
+        if self.counts[kind] == 0:
+            return None
+        return self.sums[kind] / self.counts[kind]
+
+    def profile(self):
+        """Vector de perfil listo para el recomendador (None sin favoritas)"""
+        base_profile = self.mean("base")
+        if base_profile is None:
+            return None
+        liked_profile = self.mean("liked")
+        if liked_profile is not None:
+            base_profile = 0.6 * base_profile + 0.4 * liked_profile
+        disliked_profile = self.mean("disliked")
+        if disliked_profile is not None:
+            base_profile = base_profile + 0.3 * (base_profile - disliked_profile)
+        return base_profile
+
+
+def read_profile_vectors(conn, user_id, version):
+    """
+    Perfil guardado del usuario leído con la conexión ``conn`` (dentro de una
+    transacción, o en bucle sobre muchos usuarios); None si falta o si es de
+    otra versión del catálogo.
+    """
+    rows = conn.execute(
+        "SELECT kind, version, total, count FROM profile_vectors WHERE user_id = ?",
+        (user_id,),
+    ).fetchall()
+    if len(rows) != len(KINDS) or any(row[1] != version for row in rows):
+        return None
+    sums = {
+        kind: np.frombuffer(total, dtype=np.float64).copy() for kind, _, total, _ in rows
+    }
+    counts = {kind: count for kind, _, _, count in rows}
+    return ProfileVectors(version, sums, counts)
+
+
+def _write(conn, user_id, vectors):
+    conn.executemany(
+        "INSERT OR REPLACE INTO profile_vectors (user_id, kind, version, total, count) "
+        "VALUES (?, ?, ?, ?, ?)",
+        [
+            (
+                user_id,
+                kind,
+                vectors.version,
+                vectors.sums[kind].tobytes(),
+                vectors.counts[kind],
+            )
+            for kind in KINDS
+        ],
+    )
+
+
+def load_profile_vectors(user_id, store):
+    """Perfil guardado del usuario, o None si falta o es de otro escalado"""
+    with get_pool().connection() as conn:
+        return read_profile_vectors(conn, user_id, store.version)
+
+
+def rebuild_profile_vectors(user_id, store, fav_rows, liked_rows=(), disliked_rows=()):
+    """
+    Recalcula las sumas desde cero a partir de filas del feature store. Solo
+    hace falta al cambiar la versión del catálogo (o las favoritas).
+    """
+    vectors = ProfileVectors.empty(store.version, len(store.attr_cols))
+    for kind, rows in zip(KINDS, (fav_rows, liked_rows, disliked_rows)):
+        rows = np.asarray(rows, dtype=np.int64)
+        rows = rows[rows >= 0]
+        if len(rows):
+            vectors.add(kind, store.take(np.sort(rows)))
+    with get_pool().transaction() as conn:
+        _write(conn, user_id, vectors)
+    return vectors
+
+
+def record_feedback(user_id, track_id, polarity, store=None, row=None):
+    """
+    Registra el feedback y, en la misma transacción, mueve la fila ``row``
+    del feature store entre las sumas de likes/dislikes.
+    """
+    with get_pool().transaction() as conn:
+        previous = _insert_feedback(conn, user_id, track_id, polarity)
+        if store is not None and row is not None and row >= 0 and previous != polarity:
+            vectors = read_profile_vectors(conn, user_id, store.version)
+            if vectors is not None:
+                features = store.take([row])
+                if previous in _KIND_BY_POLARITY:
+                    vectors.add(_KIND_BY_POLARITY[previous], features, sign=-1)
+                if polarity in _KIND_BY_POLARITY:
+                    vectors.add(_KIND_BY_POLARITY[polarity], features)
+                _write(conn, user_id, vectors)
+    _invalidate(user_id)
@@ -0,0 +1,341 @@
+"""
+Banco de pruebas reproducible y sin red del recomendador.
+
+Genera catálogos sintéticos (ver benchmarks.synthetic), cronometra cada etapa
+de carga, indexado, emparejamiento y recomendación para varios tamaños de
+catálogo y números de hilos, y escribe un informe JSON comparable entre
+commits:
+
+    python -m benchmarks.run --sizes 100000 1000000 10000000 --workers 1 4
+    python -m benchmarks.run --compare base.json --output nuevo.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from backend.ann_index import build_ann_index
+from backend.catalog import ATTR_COLS, canonicalize_tracks, compact_catalog
+from backend.catalog_index import GenreIndex, SortedRangeIndex
+from backend.cluster_index import build_cluster_index
+from backend.feature_store import build_feature_store
+from backend.matcher import build_match_index, match_favs_with_features
+from backend.novelty import build_novelty_scores
+from backend.recommender import filter_catalog_rows, get_advanced_recommendations
+from backend.scoring import ScoringEngine
+from backend.sharding import ShardedScorer
+from backend.streaming import save_catalog_tables
+from benchmarks.synthetic import make_catalog, make_library
+from utils.dataset_loader import _read_source, prepare_catalog
+
+REPORT_FORMAT = 1
+DEFAULT_SIZES = [100_000, 1_000_000]
+FILTERS = {"pop_min": 40, "year_min": 1990, "year_max": 2024}
+
+
+class Recorder:
+    """Acumula tiempos por (tamaño, hilos, etapa) y los resume como informe"""
+
+    def __init__(self, repeats):
+        self.repeats = repeats
+        self.results = []
+
+    def time(self, n_tracks, stage, func, workers=None, repeats=None):
+        timings = []
+        result = None
+        for _ in range(repeats or self.repeats):
+            start = time.perf_counter()
+            result = func()
+            timings.append(time.perf_counter() - start)
+        self.results.append(
+            {
+                "n_tracks": n_tracks,
+                "workers": workers,
+                "stage": stage,
+                "seconds": statistics.median(timings),
+                "min_seconds": min(timings),
+                "repeats": len(timings),
+            }
+        )
+        label = stage if workers is None else f"{stage}[{workers}]"
+        print(f"  {label:<32} {statistics.median(timings) * 1000:10.3f} ms", flush=True)
+        return result
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_size(recorder, n_tracks, workers, library_size, workdir, loaders=True):
+    print(f"\n== {n_tracks:,} canciones ==", flush=True)
+    raw = recorder.time(n_tracks, "generate", lambda: make_catalog(n_tracks), repeats=1)
+
+    # ===== CARGA =====
+    if loaders:
+        csv_path = os.path.join(workdir, f"catalog_{n_tracks}.csv")
+        parquet_path = os.path.join(workdir, f"catalog_{n_tracks}.parquet")
+        raw.to_csv(csv_path, index=False)
+        loaded = recorder.time(
+            n_tracks, "load_csv", lambda: _read_source(csv_path, "csv"), repeats=1
+        )
+        compact = recorder.time(
+            n_tracks, "compact_catalog", lambda: compact_catalog(loaded), repeats=1
+        )
+        recorder.time(
+            n_tracks,
+            "write_parquet",
+            lambda: compact.to_parquet(parquet_path, index=False),
+            repeats=1,
+        )
+        recorder.time(
+            n_tracks, "load_parquet", lambda: pd.read_parquet(parquet_path), repeats=1
+        )
+        os.remove(csv_path)
+        del loaded, compact
+    catalog = recorder.time(
+        n_tracks,
+        "prepare_catalog",
+        lambda raw=raw: prepare_catalog(raw.copy()),
+        repeats=1,
+    )
+    tracks, track_id_map, genre_aliases = recorder.time(
+        n_tracks,
+        "canonicalize",
+        lambda catalog=catalog: canonicalize_tracks(catalog),
+        repeats=1,
+    )
+    # Las lambdas ya se han ejecutado: se liberan las copias intermedias
+    del raw, catalog
+
+    # ===== ÍNDICES =====
+    store_dir = os.path.join(workdir, f"store_{n_tracks}")
+    store = recorder.time(
+        n_tracks,
+        "build_feature_store",
+        lambda: build_feature_store(tracks, ATTR_COLS, store_dir=store_dir),
+        repeats=1,
+    )
+    cluster_index = recorder.time(
+        n_tracks, "build_cluster_index", lambda: build_cluster_index(store), repeats=1
+    )
+    novelty = recorder.time(
+        n_tracks, "build_novelty", lambda: build_novelty_scores(store), repeats=1
+    )
+    ann_index = recorder.time(
+        n_tracks, "build_ann_index", lambda: build_ann_index(store), repeats=1
+    )
+    genre_index = recorder.time(
+        n_tracks,
+        "build_genre_index",
+        lambda: GenreIndex.from_frame(tracks, aliases=genre_aliases),
+        repeats=1,
+    )
+    popularity_index, year_index = recorder.time(
+        n_tracks,
+        "build_range_indexes",
+        lambda: (
+            SortedRangeIndex.from_values(tracks.index, tracks["popularity"], np.int8),
+            SortedRangeIndex.from_values(tracks.index, tracks["release_year"], np.int16),
+        ),
+        repeats=1,
+    )
+    match_index = recorder.time(
+        n_tracks,
+        "build_match_index",
+        lambda: build_match_index(tracks, track_id_map),
+        repeats=1,
+    )
+
+    # ===== EMPAREJAMIENTO =====
+    library = make_library(tracks, n_tracks=min(library_size, len(tracks)))
+    recorder.time(
+        n_tracks,
+        "match_exact",
+        lambda: match_favs_with_features(library, tracks, index=match_index),
+    )
+    merged = recorder.time(
+        n_tracks,
+        "match_fuzzy",
+        lambda: match_favs_with_features(library, tracks, index=match_index, fuzzy=True),
+    )
+
+    # ===== ETAPAS DE LA PETICIÓN =====
+    exclude_ids = set(library["Spotify - id"].dropna())
+    indexes = {
+        "genre_index": genre_index,
+        "popularity_index": popularity_index,
+        "year_index": year_index,
+        "track_id_map": track_id_map,
+    }
+    rows = recorder.time(
+        n_tracks,
+        "filter_rows",
+        lambda: filter_catalog_rows(
+            tracks, exclude_ids=exclude_ids, genre="pop, rock", **FILTERS, **indexes
+        ),
+    )
+    matrix = recorder.time(n_tracks, "take_features", lambda: store.take(rows))
+    profile = store.transform(merged).mean(axis=0)
+    for n_workers in workers:
+        engine = ScoringEngine(n_workers=n_workers, parallel_threshold=0)
+        recorder.time(
+            n_tracks,
+            "similarity_filtered",
+            lambda: engine.similarity(matrix, profile),
+            workers=n_workers,
+        )
+        recorder.time(
+            n_tracks,
+            "similarity_full",
+            lambda: engine.similarity(store.features, profile),
+            workers=n_workers,
+        )
+        engine.close()
+    recorder.time(n_tracks, "ann_search", lambda: ann_index.search(profile, 60))
+
+    common = dict(
+        topn=20,
+        exclude_ids=exclude_ids,
+        feature_store=store,
+        cluster_index=cluster_index,
+        novelty_scores=novelty,
+        **FILTERS,
+        **indexes,
+    )
+    recorder.time(
+        n_tracks,
+        "recommend",
+        lambda: get_advanced_recommendations(merged, tracks, ATTR_COLS, **common),
+    )
+    recorder.time(
+        n_tracks,
+        "recommend_ann",
+        lambda: get_advanced_recommendations(
+            merged, tracks, ATTR_COLS, ann_index=ann_index, **common
+        ),
+    )
+    recorder.time(
+        n_tracks,
+        "recommend_stream",
+        lambda: get_advanced_recommendations(
+            merged, tracks, ATTR_COLS, stream=True, **common
+        ),
+    )
+    # Tabla y track_id_map leídos del Parquet del store, sin el DataFrame
+    save_catalog_tables(store, tracks, track_id_map, genre_aliases)
+    on_disk = {key: value for key, value in common.items() if key != "track_id_map"}
+    recorder.time(
+        n_tracks,
+        "recommend_stream_parquet",
+        lambda: get_advanced_recommendations(
+            merged, None, ATTR_COLS, stream=True, **on_disk
+        ),
+    )
+    for n_workers in workers:
+        if n_workers < 2:
+            continue
+        shards = ShardedScorer.spawn(n_workers, store)
+        recorder.time(
+            n_tracks,
+            "recommend_sharded",
+            lambda: get_advanced_recommendations(
+                merged, None, ATTR_COLS, shards=shards, **common
+            ),
+            workers=n_workers,
+        )
+        shards.close()
+    recorder.time(
+        n_tracks,
+        "recommend_genre",
+        lambda: get_advanced_recommendations(
+            merged, tracks, ATTR_COLS, genre="pop, rock", **common
+        ),
+    )
+
+
+def compare_reports(base, current, threshold=0.2):
+    """Etapas cuya mediana empeora más de ``threshold`` respecto al informe base"""
+    key = lambda r: (r["n_tracks"], r["workers"], r["stage"])  # noqa: E731
+    base_times = {key(r): r["seconds"] for r in base["results"]}
+    regressions = []
+    for result in current["results"]:
+        before = base_times.get(key(result))
+        if before and result["seconds"] > before * (1 + threshold):
+            regressions.append({**result, "base_seconds": before})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--library-size", type=int, default=500)
+    parser.add_argument("--skip-loaders", action="store_true")
+    parser.add_argument("--output", default="benchmark_report.json")
+    parser.add_argument("--compare", help="informe JSON base para detectar regresiones")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    recorder = Recorder(args.repeats)
+    with tempfile.TemporaryDirectory(prefix="bench-") as workdir:
+        for n_tracks in args.sizes:
+            bench_size(
+                recorder,
+                n_tracks,
+                sorted(set(args.workers)),
+                args.library_size,
+                workdir,
+                loaders=not args.skip_loaders,
+            )
+
+    report = {
+        "format": REPORT_FORMAT,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "args": vars(args),
+        "results": recorder.results,
+    }
+    with open(args.output, "w") as fh:
+        json.dump(report, fh, indent=2)
+    print(f"\nInforme guardado en {args.output}")
+
+    if args.compare:
+        with open(args.compare) as fh:
+            regressions = compare_reports(json.load(fh), report, args.threshold)
+        for r in regressions:
+            print(
+                f"REGRESIÓN {r['stage']} ({r['n_tracks']:,}, hilos={r['workers']}): "
+                f"{r['base_seconds']:.4f}s -> {r['seconds']:.4f}s"
+            )
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+
+GENRES = [
+    "acoustic",
+    "alt-rock",
+    "ambient",
+    "blues",
+    "classical",
+    "country",
+    "dance",
+    "edm",
+    "electronic",
+    "folk",
+    "funk",
+    "hip-hop",
+    "indie-pop",
+    "j-pop",
+    "jazz",
+    "k-pop",
+    "latin",
+    "metal",
+    "pop",
+    "r-n-b",
+    "reggaeton",
+    "rock",
+    "soul",
+    "techno",
+]
+
+_ALPHABET = np.array(list("0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"))
+
+
+def _spotify_ids(n, rng):
+    """Ids de 22 caracteres en base62, como los de Spotify"""
+    chars = _ALPHABET[rng.integers(0, len(_ALPHABET), size=(n, 22))]
+    return pd.Series(chars.view("<U22").ravel(), dtype="string")
+
+
+def _labels(prefix, codes):
+    return pd.Series(codes).map(lambda code: f"{prefix} {code}").astype("string")
+
+
+def make_catalog(n_tracks, duplicate_ratio=0.15, seed=42):
+    """
+    Catálogo sintético con el esquema del dataset de HuggingFace.
+
+    Una fracción ``duplicate_ratio`` de las filas repite título y artista de
+    otra con distinto ``track_id``, género y popularidad, igual que las
+    versiones de una canción publicadas en varios álbumes o géneros.
+    """
+    rng = np.random.default_rng(seed)
+    n_unique = max(1, int(n_tracks * (1 - duplicate_ratio)))
+    source = np.concatenate(
+        [np.arange(n_unique), rng.integers(0, n_unique, n_tracks - n_unique)]
+    )
+    rng.shuffle(source)
+
+    n_artists = max(1, n_unique // 12)
+    artist = source % n_artists
+    album = source // 10
+
+    df = pd.DataFrame(
+        {
+            "track_id": _spotify_ids(n_tracks, rng),
+            "artists": _labels("Artist", artist),
+            "album_name": _labels("Album", album),
+            "track_name": _labels("Song", source),
+            "popularity": rng.integers(0, 101, n_tracks).astype(np.int8),
+            "duration_ms": rng.normal(220_000, 50_000, n_tracks)
+            .clip(30_000, 900_000)
+            .astype(np.int32),
+            "explicit": rng.random(n_tracks) < 0.1,
+            "danceability": rng.beta(5, 3, n_tracks).astype(np.float32),
+            "energy": rng.beta(4, 3, n_tracks).astype(np.float32),
+            "key": rng.integers(0, 12, n_tracks).astype(np.int8),
+            "loudness": rng.normal(-8, 4, n_tracks).clip(-50, 3).astype(np.float32),
+            "mode": (rng.random(n_tracks) < 0.65).astype(np.int8),
+            "speechiness": rng.beta(1, 12, n_tracks).astype(np.float32),
+            "acousticness": rng.beta(1, 2, n_tracks).astype(np.float32),
+            "instrumentalness": (rng.beta(0.3, 3, n_tracks)).astype(np.float32),
+            "liveness": rng.beta(2, 8, n_tracks).astype(np.float32),
+            "valence": rng.beta(3, 3, n_tracks).astype(np.float32),
+            "tempo": rng.normal(120, 28, n_tracks).clip(40, 230).astype(np.float32),
+            "time_signature": np.full(n_tracks, 4, dtype=np.int8),
+            "track_genre": pd.Categorical.from_codes(
+                rng.integers(0, len(GENRES), n_tracks), categories=GENRES
+            ),
+        }
+    )
+    # Algunos álbumes llevan el año en el nombre (de ahí sale release_year)
+    with_year = rng.random(n_tracks) < 0.7
+    years = rng.integers(1960, 2025, n_tracks).astype(str)
+    df.loc[with_year, "album_name"] = (
+        df.loc[with_year, "album_name"] + " (" + years[with_year] + ")"
+    )
+    return df
+
+
+def make_library(catalog, n_tracks=500, miss_ratio=0.1, alias_ratio=0.2, seed=7):
+    """
+    Biblioteca de usuario con las columnas del export de Spotify.
+
+    ``alias_ratio`` de las pistas llega sin id (solo título/artista, con
+    mayúsculas y "feat." como en la exportación) y ``miss_ratio`` no existe en
+    el catálogo, para ejercitar toda la cadena de emparejamiento.
+    """
+    rng = np.random.default_rng(seed)
+    sample = catalog.iloc[rng.choice(len(catalog), size=n_tracks, replace=False)]
+    library = pd.DataFrame(
+        {
+            "Track name": sample["track_name"].to_numpy(dtype=object),
+            "Artist name": sample["artists"].to_numpy(dtype=object),
+            "Spotify - id": sample["track_id"].to_numpy(dtype=object),
+        }
+    )
+    kind = rng.random(n_tracks)
+    alias = kind < alias_ratio
+    library.loc[alias, "Spotify - id"] = None
+    library.loc[alias, "Track name"] = (
+        library.loc[alias, "Track name"].str.upper() + " (feat. Someone)"
+    )
+    missing = (kind >= alias_ratio) & (kind < alias_ratio + miss_ratio)
+    library.loc[missing, "Spotify - id"] = _spotify_ids(int(missing.sum()), rng).to_numpy()
+    library.loc[missing, "Track name"] = "Unknown song"
+    return library
@@ -11,10 +11,17 @@ from PyQt6.QtWidgets import (
     QLineEdit,
     QGroupBox,
     QTabWidget,
+    QProgressBar,
+)
+from PyQt6.QtCore import QThreadPool
+from frontend.workers import (
+    RECOMMEND_STAGES,
+    Worker,
+    load_catalog_task,
+    load_favs_task,
+    match_task,
+    recommend_task,
 )
-from backend.recommender import get_recommendations, filter_by_genre
-from backend.matcher import match_favs_with_features
-from utils.fileloader import load_csv
 import pandas as pd
 import webbrowser
 
@@ -26,9 +33,12 @@ class MainWindow(QWidget):
         self.setStyleSheet("background-color: #222; color: #eee; font-size: 13px;")
         self.resize(1350, 800)
         self.user_favs = None
-        self.tracks_ds = None
+        self.catalog = None
         self.merged_favs = None
         self.last_recs = None
+        # Las tareas pesadas corren en segundo plano; una a la vez
+        self.pool = QThreadPool(self)
+        self.worker = None
 
         layout = QHBoxLayout()
         sidebar = QVBoxLayout()
@@ -78,6 +88,25 @@ class MainWindow(QWidget):
         sidebar.addWidget(self.btn_save)
 
         sidebar.addStretch()
+
+        self.lbl_status = QLabel("")
+        sidebar.addWidget(self.lbl_status)
+
+        self.progress = QProgressBar()
+        self.progress.setVisible(False)
+        sidebar.addWidget(self.progress)
+
+        self.btn_cancel = QPushButton("Cancelar")
+        self.btn_cancel.setVisible(False)
+        self.btn_cancel.clicked.connect(self.cancel_task)
+        sidebar.addWidget(self.btn_cancel)
+
+        self.task_buttons = [
+            self.btn_load_favs,
+            self.btn_load_ds,
+            self.btn_match,
+            self.btn_recommend,
+        ]
         layout.addLayout(sidebar)
 
         self.tabs = QTabWidget()
@@ -89,62 +118,119 @@ class MainWindow(QWidget):
         layout.addLayout(main_area)
         self.setLayout(layout)
 
+    # ===== TAREAS EN SEGUNDO PLANO =====
+    def start_task(self, worker, on_finished):
+        """Lanza ``worker`` en el pool; ``on_finished`` recibe su resultado"""
+        self.worker = worker
+        # end_task primero: la interfaz se reactiva antes de mostrar diálogos
+        for signal in (
+            worker.signals.finished,
+            worker.signals.failed,
+            worker.signals.cancelled,
+        ):
+            signal.connect(self.end_task)
+        worker.signals.progress.connect(self.on_task_progress)
+        worker.signals.finished.connect(on_finished)
+        worker.signals.failed.connect(self.on_task_failed)
+        worker.signals.cancelled.connect(self.on_task_cancelled)
+
+        for button in self.task_buttons:
+            button.setEnabled(False)
+        self.progress.setRange(0, worker.task.total)
+        self.progress.setValue(0)
+        self.progress.setVisible(True)
+        self.btn_cancel.setEnabled(True)
+        self.btn_cancel.setVisible(True)
+        self.pool.start(worker)
+
+    def on_task_progress(self, done, total, stage):
+        self.progress.setRange(0, total)
+        self.progress.setValue(done)
+        self.lbl_status.setText(stage)
+
+    def on_task_failed(self, error):
+        QMessageBox.critical(self, "Error", error.strip().splitlines()[-1])
+
+    def on_task_cancelled(self):
+        self.lbl_status.setText("Cancelado")
+
+    def end_task(self, *_):
+        self.worker = None
+        for button in self.task_buttons:
+            button.setEnabled(True)
+        self.progress.setVisible(False)
+        self.btn_cancel.setVisible(False)
+
+    def cancel_task(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            self.btn_cancel.setEnabled(False)
+            self.lbl_status.setText("Cancelando...")
+
+    def closeEvent(self, event):
+        self.cancel_task()
+        self.pool.waitForDone()
+        super().closeEvent(event)
+
+    # ===== ACCIONES =====
     def load_fav_songs(self):
         fname, _ = QFileDialog.getOpenFileName(
             self, "Selecciona tu archivo de canciones gustadas (CSV)"
         )
         if fname:
-            self.user_favs = load_csv(fname)
-            QMessageBox.information(
-                self, "Éxito", "Lista de favoritas cargada correctamente."
-            )
+            self.start_task(Worker(load_favs_task, fname), self.on_favs_loaded)
+
+    def on_favs_loaded(self, favs):
+        self.user_favs = favs
+        QMessageBox.information(
+            self, "Éxito", "Lista de favoritas cargada correctamente."
+        )
 
     def load_dataset(self):
         fname, _ = QFileDialog.getOpenFileName(self, "Selecciona el dataset tracks.csv")
         if fname:
-            self.tracks_ds = load_csv(fname)
-            QMessageBox.information(
-                self, "Éxito", "Dataset de tracks cargado correctamente."
+            self.start_task(
+                Worker(load_catalog_task, fname, stages=2), self.on_dataset_loaded
             )
 
+    def on_dataset_loaded(self, catalog):
+        self.catalog = catalog
+        # Las favoritas emparejadas apuntan a filas del catálogo anterior
+        self.merged_favs = None
+        QMessageBox.information(
+            self, "Éxito", "Dataset de tracks cargado correctamente."
+        )
+
     def match_attributes(self):
-        if self.user_favs is not None and self.tracks_ds is not None:
-            self.merged_favs = match_favs_with_features(self.user_favs, self.tracks_ds)
-            count = len(self.merged_favs)
-            if count == 0:
-                QMessageBox.warning(
-                    self, "Sin coincidencias", "No se encontraron coincidencias."
-                )
-            else:
-                QMessageBox.information(
-                    self, "Completado", f"Encontradas {count} favoritas en el dataset."
-                )
+        if self.user_favs is not None and self.catalog is not None:
+            self.start_task(
+                Worker(match_task, self.user_favs, self.catalog, stages=2),
+                self.on_matched,
+            )
         else:
             QMessageBox.warning(
                 self, "Falta archivo", "Carga archivos antes de emparejar."
             )
 
+    def on_matched(self, merged_favs):
+        self.merged_favs = merged_favs
+        count = len(self.merged_favs)
+        if count == 0:
+            QMessageBox.warning(
+                self, "Sin coincidencias", "No se encontraron coincidencias."
+            )
+        else:
+            QMessageBox.information(
+                self, "Completado", f"Encontradas {count} favoritas en el dataset."
+            )
+
     def recommend_songs(self):
-        if self.merged_favs is None or self.tracks_ds is None:
+        if self.merged_favs is None or self.catalog is None:
             QMessageBox.warning(
                 self, "Falta datos", "Busca primero los atributos de tus favoritas."
             )
             return
 
-        attr_cols = [
-            "danceability",
-            "energy",
-            "key",
-            "loudness",
-            "mode",
-            "speechiness",
-            "acousticness",
-            "instrumentalness",
-            "liveness",
-            "valence",
-            "tempo",
-            "duration_ms",
-        ]
         already_liked_ids = (
             set(self.user_favs["Spotify - id"])
             if "Spotify - id" in self.user_favs
@@ -152,30 +238,30 @@ class MainWindow(QWidget):
         )
 
         genre_filter = self.genre_in.text() or None
-        filtered_tracks = self.tracks_ds.copy()
-        if genre_filter:
-            filtered_tracks = filter_by_genre(filtered_tracks, genre_filter)
-
         pop_min = self.popularity_in.text() or None
         year_min = self.year_min_in.text() or None
         year_max = self.year_max_in.text() or None
-        recs = get_recommendations(
+        worker = Worker(
+            recommend_task,
             self.merged_favs,
-            filtered_tracks,
-            attr_cols,
+            self.catalog,
+            stages=len(RECOMMEND_STAGES),
             topn=20,
             pop_min=pop_min,
             year_min=year_min,
             year_max=year_max,
             exclude_ids=already_liked_ids,
+            genre=genre_filter,
         )
+        self.start_task(worker, self.show_recommendations)
 
+    def show_recommendations(self, recs):
         self.last_recs = recs
-        cols = ["name", "artists", "sim", "popularity", "release_date", "id"]
+        cols = ["track_name", "artists", "sim", "popularity", "release_date", "track_id"]
         self.tbl_result.setRowCount(recs.shape[0])
         self.tbl_result.setColumnCount(len(cols))
         self.tbl_result.setHorizontalHeaderLabels(cols)
-        for i, row in recs.iterrows():
+        for i, (_, row) in enumerate(recs.iterrows()):
             for j, col in enumerate(cols):
                 self.tbl_result.setItem(i, j, QTableWidgetItem(str(row.get(col, ""))))
         self.tbl_result.resizeColumnsToContents()
@@ -193,6 +279,6 @@ class MainWindow(QWidget):
 
     def open_spotify_link(self, row, col):
         rec = self.last_recs.iloc[row]
-        if "id" in rec:
-            url = f"https://open.spotify.com/track/{rec['id']}"
+        if "track_id" in rec:
+            url = f"https://open.spotify.com/track/{rec['track_id']}"
             webbrowser.open(url)
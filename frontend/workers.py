@@ -0,0 +1,137 @@
+import threading
+import traceback
+
+from PyQt6.QtCore import QObject, QRunnable, pyqtSignal
+
+from backend.catalog import Catalog
+from backend.matcher import build_match_index, match_favs_with_features
+from backend.recommender import get_recommendations
+from backend.tracing import Tracer
+from utils.fileloader import load_csv
+
+# Etapas que registra get_advanced_recommendations en el camino en memoria
+RECOMMEND_STAGES = (
+    "filters",
+    "scaling",
+    "profile",
+    "clustering",
+    "novelty",
+    "similarity",
+    "diversity",
+    "hybrid_score",
+    "rerank",
+)
+
+
+class Cancelled(Exception):
+    """La tarea se canceló desde la interfaz"""
+
+
+class WorkerSignals(QObject):
+    progress = pyqtSignal(int, int, str)  # etapas hechas, total, etapa actual
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+
+class Task:
+    """
+    Lo que ve la función en segundo plano: ``stage()`` informa del progreso y
+    es a la vez punto de cancelación (la cancelación es cooperativa: una etapa
+    en curso termina, pero la siguiente ya no empieza).
+    """
+
+    def __init__(self, signals, total):
+        self.signals = signals
+        self.total = total
+        self.done = 0
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def check(self):
+        if self._cancel.is_set():
+            raise Cancelled()
+
+    def stage(self, name):
+        self.check()
+        self.signals.progress.emit(min(self.done, self.total), self.total, name)
+        self.done += 1
+
+    def tracer(self):
+        return ProgressTracer(self)
+
+
+class ProgressTracer(Tracer):
+    """Convierte cada span del recomendador en progreso y punto de cancelación"""
+
+    def __init__(self, task):
+        super().__init__()
+        self.task = task
+
+    def start(self, name, rows_in=None):
+        self.task.stage(name)
+        return super().start(name, rows_in)
+
+
+class Worker(QRunnable):
+    """
+    Ejecuta ``fn(task, *args, **kwargs)`` en un QThreadPool y entrega el
+    resultado por señales, que Qt encola en el hilo de la interfaz.
+    """
+
+    def __init__(self, fn, *args, stages=1, **kwargs):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = WorkerSignals()
+        self.task = Task(self.signals, stages)
+
+    def cancel(self):
+        self.task.cancel()
+
+    def run(self):
+        try:
+            result = self.fn(self.task, *self.args, **self.kwargs)
+        except Cancelled:
+            self.signals.cancelled.emit()
+        except Exception:
+            self.signals.failed.emit(traceback.format_exc())
+        else:
+            if self.task.cancelled:
+                self.signals.cancelled.emit()
+                return
+            self.signals.progress.emit(self.task.total, self.task.total, "Completado")
+            self.signals.finished.emit(result)
+
+
+# ===== TAREAS =====
+def load_favs_task(task, path):
+    task.stage("Leyendo favoritas")
+    return load_csv(path)
+
+
+def load_catalog_task(task, path):
+    task.stage("Leyendo dataset")
+    df = load_csv(path)
+    task.stage("Compactando y deduplicando")
+    return Catalog.from_frame(df)
+
+
+def match_task(task, favs, catalog):
+    task.stage("Indexando catálogo")
+    index = build_match_index(catalog)
+    task.stage("Emparejando favoritas")
+    return match_favs_with_features(favs, catalog, index=index)
+
+
+def recommend_task(task, merged_favs, catalog, **kwargs):
+    return get_recommendations(
+        merged_favs, catalog, catalog.attr_cols, tracer=task.tracer(), **kwargs
+    )
@@ -0,0 +1,71 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from backend import db_sqlite
+
+
+class StubServer:
+    """
+    Servidor HTTP local para los tests. ``handler(path, headers)`` devuelve
+    ``(status, headers, body)``; cada petición queda en ``requests``.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests.append((self.path, dict(self.headers)))
+                status, headers, body = stub.handler(self.path, self.headers)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        self.closed = False
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def close(self):
+        if not self.closed:
+            self._server.shutdown()
+            self._server.server_close()
+            self.closed = True
+
+
+@pytest.fixture
+def stub_server():
+    """Arranca servidores stub con ``stub_server(handler)``; se cierran al final"""
+    servers = []
+
+    def start(handler):
+        server = StubServer(handler)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Base de datos SQLite vacía y propia de cada test"""
+    monkeypatch.setattr(db_sqlite, "DB_PATH", str(tmp_path / "usuarios.db"))
+    db_sqlite.init_db()
+    yield db_sqlite.get_pool()
+    db_sqlite.get_pool().close()
@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend.batch import batch_recommendations, load_batch_users
+from backend.catalog import Catalog
+from backend.cluster_index import build_cluster_index, load_cluster_index
+from backend.db_sqlite import LIKE, add_feedback, save_user_profile
+from backend.feature_store import build_feature_store
+from backend.novelty import build_novelty_scores, load_novelty_scores
+from backend.recommender import get_advanced_recommendations
+from backend.user_profile import rebuild_profile_vectors
+from benchmarks.synthetic import make_catalog
+from utils.dataset_loader import prepare_catalog
+
+
+@pytest.fixture
+def catalog():
+    return Catalog.from_frame(prepare_catalog(make_catalog(3000)))
+
+
+@pytest.fixture
+def store(catalog, tmp_path):
+    store = build_feature_store(
+        catalog.tracks, catalog.attr_cols, store_dir=str(tmp_path / "store")
+    )
+    build_cluster_index(store, n_clusters=8)
+    build_novelty_scores(store)
+    return store
+
+
+def test_users_are_enumerated_from_profile_vectors(db, store):
+    rng = np.random.default_rng(0)
+    # Perfil calculado sin fila en user_profiles (p. ej. usuario de Spotify)
+    rebuild_profile_vectors("spotify-user", store, rng.choice(len(store), 30))
+    save_user_profile("with-profile", "a@b.c", [], [])
+    rebuild_profile_vectors("with-profile", store, rng.choice(len(store), 5))
+    # Solo feedback, sin perfil que puntuar
+    add_feedback("feedback-only", "t1", LIKE)
+    # Perfil de otra versión del catálogo
+    stale = type(store)(
+        store.path, store.index, store.attr_cols, store.mean, store.scale, "old"
+    )
+    rebuild_profile_vectors("stale", stale, rng.choice(len(store), 5))
+
+    user_ids, profiles, library_sizes, exclusions = load_batch_users(store)
+
+    assert user_ids == ["spotify-user", "with-profile"]
+    assert profiles.shape == (2, len(store.attr_cols))
+    assert list(library_sizes) == [30, 5]
+    assert exclusions == [set(), set()]
+
+
+def test_batch_matches_individual_requests(db, catalog, store):
+    rng = np.random.default_rng(1)
+    for n, user_id in enumerate(["u1", "u2", "u3"]):
+        rebuild_profile_vectors(user_id, store, rng.choice(len(store), 10 + 40 * n))
+    users = load_batch_users(store)
+    common = dict(
+        track_id_map=catalog.track_id_map,
+        cluster_index=load_cluster_index(store),
+        novelty_scores=load_novelty_scores(store),
+        pop_min=20,
+    )
+
+    batch = pd.concat(batch_recommendations(catalog.tracks, store, users, **common))
+
+    for user_id, profile, library_size in zip(*users[:3]):
+        single = get_advanced_recommendations(
+            pd.DataFrame(index=range(library_size)),
+            catalog.tracks,
+            catalog.attr_cols,
+            feature_store=store,
+            user_profile=profile,
+            stream=True,
+            **common,
+        )
+        expected = list(single["track_id"].astype(str))
+        assert list(batch.loc[batch["user_id"] == user_id, "track_id"]) == expected
+        assert len(expected) == 20
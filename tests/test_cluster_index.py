@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from backend.cluster_index import ClusterIndex
+
+
+@pytest.fixture
+def cluster_index():
+    rng = np.random.default_rng(0)
+    labels = rng.integers(0, 12, 20_000)
+    postings = np.argsort(labels, kind="stable")
+    offsets = np.r_[0, np.cumsum(np.bincount(labels, minlength=12))]
+    return ClusterIndex(rng.normal(size=(12, 4)), labels, offsets, postings)
+
+
+@pytest.mark.parametrize("sort_rows", [True, False])
+def test_route_returns_positions_in_preferred_clusters(cluster_index, sort_rows):
+    rng = np.random.default_rng(1)
+    profile = rng.normal(size=(1, 4))
+    rows = rng.choice(len(cluster_index.labels), 2_000, replace=False)
+    if sort_rows:
+        rows = np.sort(rows)
+
+    positions = cluster_index.route(profile, rows, min_rows=400)
+
+    preferred = cluster_index.preferred_clusters(profile, rows, min_rows=400)
+    in_preferred = np.isin(cluster_index.labels[rows], preferred)
+    np.testing.assert_array_equal(positions, np.flatnonzero(in_preferred))
+    assert in_preferred.sum() >= 400
@@ -0,0 +1,139 @@
+import json
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from backend import covers
+from backend.covers import CoverResolver
+
+
+class OEmbedStub:
+    """oEmbed falso: portada por track_id; los ids "missing-*" devuelven 404"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.track_ids = []
+        self._lock = threading.Lock()
+
+    def __call__(self, path, headers):
+        url = parse_qs(urlparse(path).query)["url"][0]
+        track_id = url.rsplit("/", 1)[-1]
+        with self._lock:
+            self.track_ids.append(track_id)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.delay)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        if track_id.startswith("missing"):
+            return 404, {}, b""
+        body = json.dumps({"thumbnail_url": f"https://img.test/{track_id}.jpg"})
+        return 200, {"Content-Type": "application/json"}, body.encode()
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def oembed(stub_server):
+    stub = OEmbedStub()
+    stub.url = f"{stub_server(stub).url}/oembed"
+    return stub
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(covers, "time", clock)
+    return clock
+
+
+def make_resolver(oembed, **kwargs):
+    return CoverResolver(endpoint=oembed.url, timeout=2, **kwargs)
+
+
+def test_missing_covers_are_fetched_concurrently(db, oembed):
+    oembed.delay = 0.2
+    resolver = make_resolver(oembed, max_workers=8)
+    track_ids = [f"t{i}" for i in range(16)]
+
+    started = time.perf_counter()
+    result = resolver.resolve(track_ids)
+    elapsed = time.perf_counter() - started
+    resolver.close()
+
+    assert result == {t: f"https://img.test/{t}.jpg" for t in track_ids}
+    assert sorted(oembed.track_ids) == sorted(track_ids)
+    assert oembed.max_in_flight > 1
+    assert elapsed < len(track_ids) * oembed.delay / 2
+
+
+def test_memory_lru_serves_hits_and_evicts_oldest(db, oembed):
+    resolver = make_resolver(oembed, cache_size=2)
+    resolver.resolve(["a", "b"])
+    resolver.resolve(["a"])  # "a" pasa a ser la más reciente
+    resolver.resolve(["c"])
+
+    assert list(resolver._memory) == ["a", "c"]
+    assert sorted(oembed.track_ids) == ["a", "b", "c"]
+    # La expulsada se recupera del nivel SQLite, sin volver a la red
+    assert resolver.resolve(["b"]) == {"b": "https://img.test/b.jpg"}
+    assert len(oembed.track_ids) == 3
+    resolver.close()
+
+
+def test_sqlite_tier_serves_a_fresh_resolver_without_network(db, oembed):
+    first = make_resolver(oembed)
+    expected = first.resolve(["a", "b"])
+    first.close()
+
+    second = make_resolver(oembed)
+    assert second.resolve(["a", "b"]) == expected
+    assert sorted(oembed.track_ids) == ["a", "b"]
+    # Los aciertos de SQLite también pasan a la LRU del nuevo resolvedor
+    assert set(second._memory) == {"a", "b"}
+    second.close()
+
+
+def test_expired_covers_are_refetched(db, oembed, clock):
+    resolver = make_resolver(oembed, ttl=100, miss_ttl=10)
+    resolver.resolve(["a"])
+
+    clock.now += 99
+    resolver.resolve(["a"])
+    assert oembed.track_ids == ["a"]
+
+    clock.now += 2
+    assert resolver.resolve(["a"]) == {"a": "https://img.test/a.jpg"}
+    assert oembed.track_ids == ["a", "a"]
+    resolver.close()
+
+
+def test_missing_covers_are_negatively_cached(db, oembed, clock):
+    resolver = make_resolver(oembed, ttl=100, miss_ttl=10)
+    assert resolver.resolve(["missing-1", "a"]) == {
+        "missing-1": "",
+        "a": "https://img.test/a.jpg",
+    }
+
+    resolver.resolve(["missing-1"])
+    make_resolver(oembed, ttl=100, miss_ttl=10).resolve(["missing-1"])
+    assert oembed.track_ids.count("missing-1") == 1
+
+    # El fallo caduca antes que la portada válida
+    clock.now += 11
+    resolver.resolve(["missing-1", "a"])
+    assert oembed.track_ids.count("missing-1") == 2
+    assert oembed.track_ids.count("a") == 1
+    resolver.close()
@@ -0,0 +1,99 @@
+import json
+
+import pandas as pd
+import pytest
+import requests
+
+from benchmarks.synthetic import make_catalog
+from utils.dataset_loader import _cache_paths, fetch_dataset
+
+
+class DatasetOrigin:
+    """Origen del CSV con ETag: responde 304 si el cliente ya tiene la versión"""
+
+    def __init__(self, catalog, etag):
+        self.publish(catalog, etag)
+        self.statuses = []
+
+    def publish(self, catalog, etag):
+        self.body = catalog.to_csv(index=False).encode()
+        self.etag = etag
+
+    def __call__(self, path, headers):
+        if headers.get("If-None-Match") == self.etag:
+            self.statuses.append(304)
+            return 304, {"ETag": self.etag}, b""
+        self.statuses.append(200)
+        headers = {
+            "ETag": self.etag,
+            "Last-Modified": "Sun, 18 Oct 2026 00:00:00 GMT",
+            "Content-Type": "text/csv",
+        }
+        return 200, headers, self.body
+
+
+@pytest.fixture
+def origin(stub_server):
+    origin = DatasetOrigin(make_catalog(300), '"v1"')
+    server = stub_server(origin)
+    origin.url = f"{server.url}/dataset.csv"
+    origin.server = server
+    return origin
+
+
+def test_first_download_writes_parquet_cache(origin, tmp_path):
+    df = fetch_dataset(origin.url, cache_dir=tmp_path)
+
+    assert origin.statuses == [200]
+    assert len(df) == 300
+    assert "release_year" in df.columns
+    assert df["popularity"].dtype == "int8"
+    parquet_path, meta_path = _cache_paths(origin.url, str(tmp_path))
+    with open(meta_path) as fh:
+        meta = json.load(fh)
+    assert meta["etag"] == '"v1"'
+    assert meta["last_modified"] == "Sun, 18 Oct 2026 00:00:00 GMT"
+    pd.testing.assert_frame_equal(pd.read_parquet(parquet_path), df)
+
+
+def test_revalidation_304_reads_local_copy(origin, tmp_path):
+    first = fetch_dataset(origin.url, cache_dir=tmp_path)
+    second = fetch_dataset(origin.url, cache_dir=tmp_path)
+
+    assert origin.statuses == [200, 304]
+    _, headers = origin.server.requests[-1]
+    assert headers["If-None-Match"] == '"v1"'
+    assert headers["If-Modified-Since"] == "Sun, 18 Oct 2026 00:00:00 GMT"
+    pd.testing.assert_frame_equal(second, first)
+
+
+def test_changed_etag_downloads_new_version(origin, tmp_path):
+    fetch_dataset(origin.url, cache_dir=tmp_path)
+    origin.publish(make_catalog(120, seed=3), '"v2"')
+
+    df = fetch_dataset(origin.url, cache_dir=tmp_path)
+
+    assert origin.statuses == [200, 200]
+    assert len(df) == 120
+    _, meta_path = _cache_paths(origin.url, str(tmp_path))
+    with open(meta_path) as fh:
+        assert json.load(fh)["etag"] == '"v2"'
+    # La nueva versión queda cacheada: la siguiente carga revalida con v2
+    fetch_dataset(origin.url, cache_dir=tmp_path)
+    assert origin.statuses[-1] == 304
+
+
+def test_offline_falls_back_to_cached_parquet(origin, tmp_path):
+    cached = fetch_dataset(origin.url, cache_dir=tmp_path)
+    origin.server.close()
+
+    df = fetch_dataset(origin.url, cache_dir=tmp_path, timeout=2)
+
+    pd.testing.assert_frame_equal(df, cached)
+
+
+def test_offline_without_cache_raises(origin, tmp_path):
+    origin.server.close()
+
+    with pytest.raises(requests.RequestException):
+        fetch_dataset(origin.url, cache_dir=tmp_path, timeout=2)
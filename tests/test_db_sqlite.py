@@ -0,0 +1,26 @@
+import sqlite3
+
+import pytest
+
+
+def test_failed_commit_rolls_back_before_reusing_the_connection(db):
+    with db.transaction() as conn:
+        conn.execute("CREATE TABLE parent (id INTEGER PRIMARY KEY)")
+        conn.execute(
+            "CREATE TABLE child (parent_id INTEGER REFERENCES parent (id) "
+            "DEFERRABLE INITIALLY DEFERRED)"
+        )
+    with db.connection() as conn:
+        conn.execute("PRAGMA foreign_keys=ON")
+
+    # La clave ajena diferida solo se comprueba en el COMMIT, que falla
+    with pytest.raises(sqlite3.IntegrityError):
+        with db.transaction() as conn:
+            conn.execute("INSERT INTO child (parent_id) VALUES (1)")
+
+    with db.transaction() as conn:
+        conn.execute("INSERT INTO parent (id) VALUES (2)")
+        conn.execute("INSERT INTO child (parent_id) VALUES (2)")
+    with db.connection() as conn:
+        assert not conn.in_transaction
+        assert conn.execute("SELECT parent_id FROM child").fetchall() == [(2,)]
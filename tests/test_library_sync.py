@@ -0,0 +1,131 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from backend.library_sync import PAGE_SIZE, load_saved_tracks, sync_saved_tracks
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def saved_item(n, track_id=True):
+    added_at = (START + timedelta(minutes=n)).strftime("%Y-%m-%dT%H:%M:%SZ")
+    track = {
+        "id": f"t{n}" if track_id else None,
+        "name": f"Song {n}",
+        "artists": [{"name": f"Artist {n % 7}"}, {"name": "Guest"}],
+    }
+    return {"added_at": added_at, "track": track}
+
+
+class FakeSpotify:
+    """Cliente falso de /me/tracks: biblioteca ordenada por added_at descendente"""
+
+    def __init__(self, items):
+        self.items = list(items)
+        self.offsets = []
+
+    def add(self, *items):
+        self.items = [*items, *self.items]
+
+    def current_user_saved_tracks(self, limit=20, offset=0):
+        assert limit <= 50
+        self.offsets.append(offset)
+        page = self.items[offset : offset + limit]
+        has_next = offset + limit < len(self.items)
+        return {
+            "items": page,
+            "total": len(self.items),
+            "next": f"?offset={offset + limit}" if has_next else None,
+        }
+
+
+def library(n):
+    return [saved_item(i) for i in reversed(range(n))]
+
+
+def sync(sp):
+    sp.offsets = []
+    return sync_saved_tracks(sp, "user-1", rate=1000)
+
+
+@pytest.fixture
+def sp(db):
+    return FakeSpotify(library(120))
+
+
+def test_first_sync_downloads_every_page(sp):
+    assert sync(sp) == 120
+
+    assert sorted(sp.offsets) == [0, PAGE_SIZE, 2 * PAGE_SIZE]
+    saved = load_saved_tracks("user-1")
+    assert len(saved) == 120
+    assert list(saved.columns) == [
+        "Track name",
+        "Artist name",
+        "Spotify - id",
+        "added_at",
+    ]
+    assert saved["Spotify - id"].iloc[0] == "t119"
+    assert saved["Artist name"].iloc[0] == "Artist 0, Guest"
+
+
+def test_incremental_sync_reads_only_new_pages(sp):
+    sync(sp)
+    sp.add(saved_item(202), saved_item(201), saved_item(200))
+
+    assert sync(sp) == 3
+
+    assert sp.offsets == [0]
+    saved = load_saved_tracks("user-1")
+    assert len(saved) == 123
+    assert list(saved["Spotify - id"].iloc[:3]) == ["t202", "t201", "t200"]
+
+
+def test_incremental_sync_spanning_several_pages(sp):
+    sync(sp)
+    sp.add(*[saved_item(n) for n in reversed(range(200, 260))])
+
+    assert sync(sp) == 60
+
+    assert sp.offsets == [0, PAGE_SIZE]
+    assert len(load_saved_tracks("user-1")) == 180
+
+
+def test_unchanged_library_is_a_noop(sp):
+    sync(sp)
+
+    assert sync(sp) == 0
+    assert sp.offsets == [0]
+    assert len(load_saved_tracks("user-1")) == 120
+
+
+def test_removed_tracks_trigger_a_full_resync(sp):
+    sync(sp)
+    sp.items = [item for item in sp.items if item["track"]["id"] not in {"t5", "t60"}]
+    sp.add(saved_item(200))
+
+    assert sync(sp) == 119
+
+    # La primera página se reutiliza; el resto se vuelve a pedir por offset
+    assert sorted(sp.offsets) == [0, PAGE_SIZE, 2 * PAGE_SIZE]
+    saved = set(load_saved_tracks("user-1")["Spotify - id"])
+    assert len(saved) == 119
+    assert {"t5", "t60"}.isdisjoint(saved)
+    assert "t200" in saved
+
+
+def test_tracks_without_id_are_skipped(db):
+    items = library(10)
+    items[2] = saved_item(2, track_id=False)  # fichero local
+    items[5] = {"added_at": saved_item(5)["added_at"], "track": None}  # retirada
+    sp = FakeSpotify(items)
+
+    assert sync(sp) == 8
+    assert len(load_saved_tracks("user-1")) == 8
+
+    # El total de la API incluye esas entradas: la siguiente sync sigue siendo
+    # incremental en lugar de resincronizar entera
+    sp.add(saved_item(200, track_id=False), saved_item(201))
+    assert sync(sp) == 1
+    assert sp.offsets == [0]
+    assert len(load_saved_tracks("user-1")) == 9
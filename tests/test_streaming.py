@@ -0,0 +1,93 @@
+import pandas as pd
+import pytest
+
+from backend import streaming
+from backend.catalog import Catalog
+from backend.cluster_index import build_cluster_index
+from backend.feature_store import build_feature_store
+from backend.matcher import match_favs_with_features
+from backend.novelty import build_novelty_scores
+from backend.recommender import get_advanced_recommendations
+from backend.streaming import ParquetTracks, save_catalog_tables
+from benchmarks.synthetic import make_catalog, make_library
+from utils.dataset_loader import prepare_catalog
+
+
+@pytest.fixture(scope="module")
+def monkeypatch_module():
+    with pytest.MonkeyPatch.context() as patch:
+        yield patch
+
+
+@pytest.fixture(scope="module")
+def setup(tmp_path_factory, monkeypatch_module):
+    catalog = Catalog.from_frame(prepare_catalog(make_catalog(4000)))
+    store = build_feature_store(
+        catalog.tracks,
+        catalog.attr_cols,
+        store_dir=str(tmp_path_factory.mktemp("store")),
+    )
+    # Grupos de filas pequeños para que los tramos crucen varios
+    monkeypatch_module.setattr(streaming, "CHUNK_SIZE", 700)
+    save_catalog_tables(
+        store, catalog.tracks, catalog.track_id_map, catalog.genre_aliases
+    )
+    library = make_library(catalog.tracks, 60)
+    return {
+        "catalog": catalog,
+        "store": store,
+        "favs": match_favs_with_features(library, catalog.tracks),
+        "exclude_ids": set(library["Spotify - id"].dropna()),
+        "cluster_index": build_cluster_index(store, n_clusters=8),
+        "novelty": build_novelty_scores(store),
+    }
+
+
+def test_parquet_tracks_reads_and_takes_rows(setup):
+    tracks = setup["catalog"].tracks
+    parquet = ParquetTracks(setup["store"].path)
+
+    assert len(parquet) == len(tracks)
+    assert len(parquet.offsets) > 3
+    chunk = parquet.read(650, 1500, ["popularity", "track_genre"])
+    pd.testing.assert_frame_equal(
+        chunk, tracks.iloc[650:1500][["popularity", "track_genre"]]
+    )
+    rows = [3200, 5, 701, 699]
+    taken = parquet.take(rows)
+    assert list(taken.index) == rows
+    assert list(taken["track_id"]) == list(tracks["track_id"].iloc[rows])
+    assert len(taken["album_name"].cat.categories) <= len(rows)
+
+
+@pytest.mark.parametrize(
+    "filters, n_results",
+    [
+        ({"genre": "jazz, rock", "pop_min": 30, "year_min": 1990}, 15),
+        ({"year_max": 2005}, 15),
+        ({"genre": "nonexistent"}, 0),
+    ],
+)
+def test_stream_from_parquet_matches_in_memory(setup, filters, n_results):
+    catalog = setup["catalog"]
+    common = dict(
+        topn=15,
+        exclude_ids=setup["exclude_ids"],
+        feature_store=setup["store"],
+        cluster_index=setup["cluster_index"],
+        novelty_scores=setup["novelty"],
+        **filters,
+    )
+
+    expected = get_advanced_recommendations(
+        setup["favs"], catalog, catalog.attr_cols, stream=True, **common
+    )
+    result = get_advanced_recommendations(
+        setup["favs"], None, catalog.attr_cols, stream=True, chunk_size=500, **common
+    )
+
+    assert len(expected) == n_results
+    # Las categorías de las filas leídas solo contienen sus propios valores
+    pd.testing.assert_frame_equal(
+        result, expected, check_dtype=False, check_categorical=False
+    )
@@ -0,0 +1,65 @@
+import tracemalloc
+
+import pytest
+
+from backend.tracing import Tracer
+
+
+@pytest.fixture(autouse=True)
+def no_tracemalloc():
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    yield
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def test_memory_spans_report_peaks_and_stop_tracing():
+    tracer = Tracer(memory=True)
+    with tracer.stage("alloc"):
+        assert tracemalloc.is_tracing()
+        block = bytearray(4 << 20)
+        del block
+
+    assert not tracemalloc.is_tracing()
+    assert tracer.spans[0].peak_bytes >= 4 << 20
+
+
+def test_concurrent_tracers_keep_tracing_until_the_last_span_stops():
+    first, second = Tracer(memory=True), Tracer(memory=True)
+    span_a = first.start("a")
+    span_b = second.start("b")
+
+    first.stop(span_a)
+    assert tracemalloc.is_tracing()
+    second.stop(span_b)
+    assert not tracemalloc.is_tracing()
+
+
+def test_exception_inside_stage_releases_tracing():
+    tracer = Tracer(memory=True)
+    with pytest.raises(RuntimeError):
+        with tracer.stage("boom"):
+            raise RuntimeError("fallo")
+
+    assert not tracemalloc.is_tracing()
+    assert tracer.spans[0].name == "boom"
+
+
+def test_finish_releases_spans_left_open():
+    tracer = Tracer(memory=True)
+    tracer.start("sin_cerrar")
+    assert tracemalloc.is_tracing()
+
+    tracer.finish()
+    assert not tracemalloc.is_tracing()
+
+
+def test_tracing_started_elsewhere_is_left_running():
+    tracemalloc.start()
+    tracer = Tracer(memory=True)
+    with tracer.stage("a"):
+        pass
+    tracer.finish()
+
+    assert tracemalloc.is_tracing()
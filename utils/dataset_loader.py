@@ -1,20 +1,219 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
 import pandas as pd
 import streamlit as st
 import requests
-from io import BytesIO
+from backend.catalog import CATALOG_DTYPES, Catalog, compact_catalog
+from backend.feature_store import catalog_version, load_feature_store
+from backend.cluster_index import load_cluster_index
+from backend.novelty import load_novelty_scores
+from backend.ann_index import ANN_MIN_ROWS, ANN_MIN_ROWS_ENV, load_ann_index
+from backend.catalog_index import GenreIndex, SortedRangeIndex, derive_release_year
+from backend.matcher import build_match_index
 
+CACHE_DIR = ".dataset_cache"
+CACHE_FORMAT = 2
+SPOTIFY_DATASET_URL = "https://huggingface.co/datasets/maharshipandya/spotify-tracks-dataset/resolve/main/dataset.csv?download=true"
 
-@st.cache_data(ttl=86400)
-def load_remote_dataset(url, ext="csv"):
-    response = requests.get(url)
+
+def _cache_paths(url, cache_dir):
+    key = hashlib.sha1(url.encode()).hexdigest()[:16]
+    base = os.path.join(cache_dir, key)
+    return base + ".parquet", base + ".json"
+
+
+def _read_source(path, ext):
     if ext == "csv":
-        return pd.read_csv(BytesIO(response.content))
+        usecols = lambda col: col in CATALOG_DTYPES  # noqa: E731
+        return pd.read_csv(path, usecols=usecols)
     elif ext == "parquet":
-        return pd.read_parquet(BytesIO(response.content))
+        return pd.read_parquet(path)
     else:
         raise ValueError("Formato no soportado")
 
 
+def fetch_dataset(url, ext="csv", cache_dir=CACHE_DIR, timeout=60):
+    """
+    Descarga el dataset a una caché local en Parquet y lo revalida con
+    ETag/Last-Modified: si el servidor responde 304 se lee la copia local.
+    La descarga se vuelca a disco por bloques (no se carga entera en memoria)
+    y, si no hay red, se sirve la última copia cacheada.
+    """
+    if ext not in ("csv", "parquet"):
+        raise ValueError("Formato no soportado")
+    os.makedirs(cache_dir, exist_ok=True)
+    parquet_path, meta_path = _cache_paths(url, cache_dir)
+
+    meta = {}
+    if os.path.exists(parquet_path) and os.path.exists(meta_path):
+        with open(meta_path) as fh:
+            meta = json.load(fh)
+        if meta.get("format") != CACHE_FORMAT:
+            meta = {}
+
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+
+    try:
+        with requests.get(url, headers=headers, stream=True, timeout=timeout) as response:
+            if response.status_code == 304 and meta:
+                return pd.read_parquet(parquet_path)
+            response.raise_for_status()
+
+            fd, download_path = tempfile.mkstemp(dir=cache_dir, suffix=f".{ext}")
+            try:
+                with os.fdopen(fd, "wb") as fh:
+                    for block in response.iter_content(chunk_size=1 << 20):
+                        fh.write(block)
+                df = prepare_catalog(compact_catalog(_read_source(download_path, ext)))
+            finally:
+                os.remove(download_path)
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+    except requests.RequestException:
+        if meta:
+            # Sin conexión: se trabaja con la copia local
+            return pd.read_parquet(parquet_path)
+        raise
+
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".parquet")
+    os.close(fd)
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, parquet_path)
+    with open(meta_path, "w") as fh:
+        json.dump(
+            {
+                "url": url,
+                "format": CACHE_FORMAT,
+                "etag": etag,
+                "last_modified": last_modified,
+            },
+            fh,
+        )
+    return df
+
+
+@st.cache_data(ttl=86400)
+def load_remote_dataset(url, ext="csv"):
+    return fetch_dataset(url, ext=ext)
+
+
+def prepare_catalog(df):
+    """Columnas derivadas que se calculan una sola vez al cargar el catálogo."""
+    if "release_year" not in df.columns:
+        release_year = derive_release_year(df)
+        if release_year is not None:
+            df["release_year"] = release_year
+    return df
+
+
 def get_spotify_dataset():
-    url = "https://huggingface.co/datasets/maharshipandya/spotify-tracks-dataset/resolve/main/dataset.csv?download=true"
-    return load_remote_dataset(url, ext="csv")
+    return load_remote_dataset(SPOTIFY_DATASET_URL, ext="csv")
+
+
+@st.cache_resource(ttl=86400, show_spinner=False)
+def get_catalog():
+    """
+    Catálogo compacto y deduplicado una sola vez en la carga (ver
+    backend.catalog.Catalog).
+
+    Se comparte entre sesiones sin copiarlo en cada rerun: debe tratarse como
+    inmutable (el recomendador solo lo lee por posiciones de fila).
+
+    Devuelve ``(catalog, version)``: la huella del catálogo se calcula aquí una
+    vez por carga y no en cada rerun.
+    """
+    catalog = Catalog.from_frame(get_spotify_dataset())
+    return catalog, catalog_version(catalog.tracks, catalog.attr_cols)
+
+
+@st.cache_resource(show_spinner=False)
+def _cached_feature_store(version, attr_cols, _tracks_df):
+    return load_feature_store(_tracks_df, list(attr_cols), version=version)
+
+
+def get_catalog_feature_store(tracks_df, attr_cols, version):
+    """Feature store del catálogo; se reconstruye solo si cambia ``version``."""
+    return _cached_feature_store(version, tuple(attr_cols), tracks_df)
+
+
+@st.cache_resource(show_spinner=False)
+def _cached_cluster_index(version, _store):
+    return load_cluster_index(_store)
+
+
+def get_catalog_cluster_index(store):
+    """Índice de micro-géneros asociado a la versión actual del feature store."""
+    return _cached_cluster_index(store.version, store)
+
+
+@st.cache_resource(show_spinner=False)
+def _cached_novelty_scores(version, _store):
+    return load_novelty_scores(_store)
+
+
+def get_catalog_novelty_scores(store):
+    """Columna de novedad global asociada a la versión actual del feature store."""
+    return _cached_novelty_scores(store.version, store)
+
+
+@st.cache_resource(show_spinner=False)
+def _cached_ann_index(version, _store):
+    return load_ann_index(_store)
+
+
+def get_catalog_ann_index(store, min_rows=ANN_MIN_ROWS):
+    """
+    Índice ANN (IVF) asociado a la versión actual del feature store, solo si el
+    catálogo tiene al menos ``min_rows`` filas (``RECOMMENDER_ANN_MIN_ROWS``);
+    por debajo la búsqueda exacta es barata y no se pierde recall.
+    """
+    min_rows = int(os.environ.get(ANN_MIN_ROWS_ENV, min_rows))
+    if len(store) < min_rows:
+        return None
+    return _cached_ann_index(store.version, store)
+
+
+@st.cache_resource(show_spinner=False)
+def _cached_genre_index(version, _tracks_df, _genre_aliases):
+    return GenreIndex.from_frame(_tracks_df, aliases=_genre_aliases)
+
+
+def get_catalog_genre_index(tracks_df, store, genre_aliases=None):
+    """Índice invertido de géneros para la versión actual del catálogo."""
+    return _cached_genre_index(store.version, tracks_df, genre_aliases)
+
+
+@st.cache_resource(show_spinner=False)
+def _cached_range_indexes(version, _tracks_df):
+    popularity_index = SortedRangeIndex.from_values(
+        _tracks_df.index, _tracks_df["popularity"], dtype=np.int8
+    )
+    year_index = None
+    if "release_year" in _tracks_df.columns:
+        year_index = SortedRangeIndex.from_values(
+            _tracks_df.index, _tracks_df["release_year"], dtype=np.int16
+        )
+    return popularity_index, year_index
+
+
+def get_catalog_range_indexes(tracks_df, store):
+    """Índices ordenados de popularidad y año para la versión actual del catálogo."""
+    return _cached_range_indexes(store.version, tracks_df)
+
+
+@st.cache_resource(show_spinner=False)
+def _cached_match_index(version, _tracks_df, _track_id_map):
+    return build_match_index(_tracks_df, track_id_map=_track_id_map)
+
+
+def get_catalog_match_index(tracks_df, store, track_id_map=None):
+    """Índices hash para emparejar bibliotecas con la versión actual del catálogo."""
+    return _cached_match_index(store.version, tracks_df, track_id_map)